@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+from typing import ClassVar, Iterable, Optional
+
+
+class ApplicantRecord(object):
+    """Data of a single applicant. Fields live in slots instead of a one-row DataFrame, so a record costs a few hundred bytes and
+    setting a field is a plain attribute write. Convert it with .to_frame() or .to_row() at the model and database boundaries only
+    """
+
+    # Columns of the loan table, in table order
+    __slots__ = (
+        "id", "name", "age", "sex", "employed", "workclass", "education",
+        "marrital_status", "occupation", "race", "hours_per_week", "native_country",
+        "income", "person_home_ownership", "loan_grade", "loan_amount",
+        "cb_person_default_on_file", "loan_status", "interest_rate", "notes"
+        )
+
+    columns: ClassVar[tuple] = __slots__
+
+    id: Optional[int]
+    name: Optional[str]
+    age: Optional[int]
+    sex: Optional[str]
+    employed: Optional[str]
+    workclass: Optional[str]
+    education: Optional[str]
+    marrital_status: Optional[str]
+    occupation: Optional[str]
+    race: Optional[str]
+    hours_per_week: Optional[str]
+    native_country: Optional[str]
+    income: Optional[str]
+    person_home_ownership: Optional[str]
+    loan_grade: Optional[str]
+    loan_amount: Optional[int]
+    cb_person_default_on_file: Optional[str]
+    loan_status: Optional[int]
+    interest_rate: Optional[int]
+    notes: Optional[str]
+
+    def __init__(self, **values) -> None:
+        """Construct a record. Fields that aren't given are None
+
+        Args:
+            **values: initial values of the fields
+        """
+
+        for col in ApplicantRecord.columns:
+            setattr(self, col, None)
+
+        self.update(values.keys(), values.values())
+
+    def update(self, col_names: Iterable[str], values: Iterable) -> None:
+        """Set several fields at once. NumPy scalars are stored as plain python values
+
+        Args:
+            col_names (Iterable[str]): names of the fields. Must be names of the columns. See ApplicantRecord.columns
+            values (Iterable): values of the fields in the same order
+        """
+
+        for col, value in zip(col_names, values):
+            setattr(self, col, value.item() if isinstance(value, np.generic) else value)
+
+    def to_row(self) -> tuple:
+        """Values of all fields in column order
+
+        Returns:
+            tuple: row of the loan table
+        """
+
+        return tuple(getattr(self, col) for col in ApplicantRecord.columns)
+
+    def to_dict(self) -> dict:
+        """Values of all fields by column name
+
+        Returns:
+            dict: field values
+        """
+
+        return {col: getattr(self, col) for col in ApplicantRecord.columns}
+
+    def to_frame(self, columns: list = None) -> pd.DataFrame:
+        """One-row DataFrame with the values of this record
+
+        Args:
+            columns (list, optional): columns to include. Defaults to all columns.
+
+        Returns:
+            pd.DataFrame: record as a DataFrame
+        """
+
+        columns = list(columns or ApplicantRecord.columns)
+
+        return pd.DataFrame([[getattr(self, col) for col in columns]], columns = columns)
+
+    @classmethod
+    def from_row(cls, row: Iterable) -> "ApplicantRecord":
+        """Construct a record from a row of the loan table
+
+        Args:
+            row (Iterable): values of all fields in column order. See .to_row()
+
+        Returns:
+            ApplicantRecord: record with the values of the row
+        """
+
+        record = cls()
+        record.update(ApplicantRecord.columns, row)
+
+        return record
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, ApplicantRecord) and self.to_row() == other.to_row()
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{col}={value!r}" for col, value in self.to_dict().items() if value is not None)
+
+        return f"ApplicantRecord({fields})"
@@ -1,5 +1,9 @@
 import pdfplumber
 import re
+from io import BytesIO
+from pdfminer.psparser import PSException
+from pdfplumber.utils.exceptions import MalformedPDFException, PdfminerException
+from typing import BinaryIO, Iterator, Tuple, Union
 
 ##  Exceptions
 class PDFSyntaxError(Exception):
@@ -9,19 +13,74 @@ class LoanApplicationParser(object):
     """Object for parsing loan applications
     """
 
-    def __init__(self, file_name: str) -> None:
+    # Labeled fields of the application. Race and Sex may share a line with other text and their value may start on the next line,
+    # every answer takes a whole line
+    field_pattern = re.compile(r"(?P<label>Race|Sex):\s*(?P<value>(?!(?:Race|Sex|(?i:Answer)):)[a-zA-Z]*)|^(?i:Answer):[ \t]*(?P<answer>[a-zA-Z/ \t0-9,]+?)[ \t]*$", flags = re.M)
+
+    joint_keys: list = ["workclass", "occupation", "hours_per_week"] # Fields answered by the joint question 2
+
+    # Errors of files that can't be read as a pdf, like a renamed attachment. pdfminer errors raised while pages are read derive from PSException
+    read_errors: tuple = (IOError, PDFSyntaxError, PdfminerException, MalformedPDFException, PSException)
+
+    def __init__(self, source: Union[str, bytes, BinaryIO], fast: bool = False, raw_text: bool = False) -> None:
         """Construct a loan parser
 
         Args:
-            file_name (str): Name of the application
+            source (Union[str, bytes, BinaryIO]): Name of the application file, its content or a file-like object with its content
+            fast (bool, optional): stop reading pages as soon as all fields have been found. Defaults to False.
+            raw_text (bool, optional): build text straight from the character stream instead of pdfplumber's layout-aware extraction. Defaults to False.
         """
         
-        self.file_name: str = file_name
+        self.source: Union[str, bytes, BinaryIO] = source
+        self.fast: bool = fast
+        self.raw_text: bool = raw_text
 
         self.keys: list = ["sex", "race", "employed", "workclass", "occupation","hours_per_week", "marrital_status", "person_home_ownership", 
             "education", "native_country", "loan_grade", "cb_person_default_on_file"
             ]
 
+    @staticmethod
+    def _extract_raw_text(page: pdfplumber.page.Page, tolerance: float = 3) -> str:
+        """Cheap text extraction. Walks characters in the order they are drawn and starts a new line when the vertical position changes.
+        Skips character clustering of pdfplumber, which is the most expensive part of text extraction
+
+        Args:
+            page (pdfplumber.page.Page): page of the pdf file
+            tolerance (float, optional): distance in points that separates lines and words. Defaults to 3.
+
+        Returns:
+            str: text of the page
+        """
+
+        parts: list = []
+        previous = None
+
+        for char in page.chars:
+            if previous is not None:
+                if abs(char["top"] - previous["top"]) > tolerance:
+                    parts.append("\n")
+                elif char["x0"] - previous["x1"] > tolerance:
+                    parts.append(" ")
+
+            parts.append(char["text"])
+            previous = char
+
+        return "".join(parts)
+
+    def _page_texts(self) -> Iterator[str]:
+        """Extracts text from a pdf file page by page. Pages are only read when the next one is requested
+
+        Yields:
+            str: text of the next page
+        """
+
+        # Documents received as bytes are parsed straight from memory
+        source = BytesIO(self.source) if isinstance(self.source, (bytes, bytearray)) else self.source
+
+        with pdfplumber.open(source) as pdf:
+            for page in pdf.pages:
+                yield LoanApplicationParser._extract_raw_text(page) if self.raw_text else (page.extract_text() or "")
+
     def get_text(self) -> str:
         """Extracts text from a pdf file
 
@@ -29,40 +88,33 @@ class LoanApplicationParser(object):
             str: string corresponding to a text of a given file or an empty string if file name was incorrerct or if no such file exists
         """
 
-        text = ""
-
         try:
-            pdf = pdfplumber.open(self.file_name)
-
-            for page in pdf.pages:
-                text += page.extract_text()
-        except (IOError, PDFSyntaxError):
+            return "\n".join(self._page_texts()) # Single join instead of repeated concatenation
+        except LoanApplicationParser.read_errors:
             return ""
-        finally:
-            pdf.close()
-
-        return text
 
-    def _get_race_and_sex(self, data: dict, application: str) -> None:
-        """Extract user race and gender from the pdf application
+    def _extract_fields(self, application: str) -> Tuple[dict, list]:
+        """Extract all labeled fields from the pdf application in a single pass over the text
 
         Args:
-            data (dict): dictionary to which the data extracted from pdf will be pushed
             application (str): string equivalent of user application. See .get_text()
-        """
 
-        # Find Race field and extract user answer
-        race: str = re.findall(r"Race:\s*[a-zA-Z]*\s*\n*", application)[0]
-        race = race.replace("Race: ", "")
+        Returns:
+            Tuple[dict, list]: race and sex of the user; answers to the questions in the order they appear in the application
+        """
 
-        data["race"] = race.strip() # Push to dictionary
+        labeled: dict = {}
+        answers: list = []
 
-        # Find Sex field and extract user answer
-        sex: str = re.findall(r"Sex:\s*[a-zA-Z]*\s*\n*", application)[0]
-        sex = sex.replace("Sex: ", "")
+        for match in LoanApplicationParser.field_pattern.finditer(application):
+            if (answer := match.group("answer")) is not None:
+                answers.append(answer.strip())
+            elif value := match.group("value").strip(): # Label without a value counts as a missing field
+                labeled.setdefault(match.group("label").lower(), value) # Only the first Race and Sex fields count
 
-        data["sex"] = sex.strip() # Push to dictionary
+        return labeled, answers
 
+    @staticmethod
     def _separate_joint_question(answer: str) -> list:
         """Separates joint questions like question 2 which includes answer to 3 datafields 
 
@@ -74,13 +126,20 @@ class LoanApplicationParser(object):
         """
 
         try:
-            separated_answers = answer.split(",")
+            separated_answers = [separated_answer.strip() for separated_answer in answer.split(",")]
         except AttributeError:
             return []
 
         return separated_answers
 
-        
+    def _single_keys(self) -> list:
+        """Keys answered by separate questions, in the order of the questions. Joint question is the second one
+
+        Returns:
+            list: keys that don't belong to the joint question, race and sex
+        """
+
+        return [key for key in self.keys if key not in ["race", "sex"] + LoanApplicationParser.joint_keys]
 
     def _push_answers(self, data: dict, answers: list) -> None:
         """Go over all answers extracted from user application to push them to corresponding keys in dictionary
@@ -90,82 +149,68 @@ class LoanApplicationParser(object):
             answers (list): user answers extracted from application pdf
 
         Raises:
-            ValueError: If user answers a joint question incorrectly and it is impossible to separate it
+            ValueError: If user answers a joint question incorrectly and it is impossible to separate it or if some answers are missing
         """
 
-        # Iterate though dictionary to add user answers to application questions
+        single_keys: list = self._single_keys()
 
-        index = 0   # Index of the current question to be pushed into dictionary
-        try:
-            for key in data:
-
-                # Flag for joint questions where user answered N/A
-                is_joint: bool = key in ["workclass","occupation","hours_per_week"]
-
-                if key not in ["race", "sex"]:     # To skip race and sex key/value pairs
-                    if is_joint and answers[1] == "N/A":  # If this is a joint question and user answered N/A
-                        data[key] = "N/A" # Populate all questions with N/A
-                        index = 2
-                    elif is_joint and answers[1] != "N/A": # if joint question but user didn't answer N/A
-                        separated_answers = LoanApplicationParser.__separate_joint_question(answers[1]) # Separate each question from a single string
-                        data.update({"workclass": separated_answers[0], "occupation": separated_answers[1], "hours_per_week": separated_answers[2]})
-                        index = 2
-                    else:
-                        data[key] = answers[index]
-                        index += 1
-        except KeyError:  # __separate_joint_question returned [] or wrong data
-            raise ValueError() # If answer 1 formated incorrectly
-                
-
-
-    def _get_answers(self, data: dict, application: str) -> None:
-        """Extract answers to question in loan application pdf
-
-        Args:
-            data (dict): data structure to which answers will be pushed
-            application (str): string equivalent of user application. See .get_text()
-        """
+        if len(answers) < len(single_keys) + 1:
+            raise ValueError(f"Expected {len(single_keys) + 1} answers, found {len(answers)}")
 
-        # Match all fields with "Asnwer: " in it
-        answers: list = re.findall(r"^Answer:\s*[a-zA-Z/\s0-9,]+\s*\n*$", application, flags = re.M|re.I)
-        
-        # Extract user answer from matched lines
-        for i in range(0, len(answers)):
-            answers[i] = answers[i].replace("Answer: ", "")
+        joint_answer = answers[1]
 
-        self.__push_answers(data, answers)
+        if joint_answer == "N/A":  # If user answered N/A to the joint question, populate all its fields with N/A
+            data.update(dict.fromkeys(LoanApplicationParser.joint_keys, "N/A"))
+        elif len(separated_answers := LoanApplicationParser._separate_joint_question(joint_answer)) == len(LoanApplicationParser.joint_keys):
+            data.update(zip(LoanApplicationParser.joint_keys, separated_answers))
+        else:
+            raise ValueError("Answer to question 2 must list workclass, occupation and hours per week separated by commas") # If answer 1 formated incorrectly
 
+        data.update(zip(single_keys, answers[:1] + answers[2:]))
 
     def parse(self) -> dict:
         """Parse loan application pdf. Extracts all relevant data from the pdf file
 
+        Raises:
+            ValueError: If some fields of the application are missing or formated incorrectly
+
         Returns:
             dict: dictionary containing answers to question in loan application or an empty dictionary of could't parse file
         """
 
         usr_data: dict = dict.fromkeys(self.keys) # Create an empty dictionary
 
-        if (application := self.get_text()) != "":
-
-            self.__get_race_and_sex(usr_data, application)
-            self.__get_answers(usr_data, application)
-            
-            return usr_data
-                    
-        
-        return {}
-
-
-    
-
-
+        labeled: dict = {}
+        answers: list = []
+        has_text: bool = False
 
+        answer_count: int = len(self._single_keys()) + 1 # Number of answers in a complete application
 
-       
-
+        try:
+            for page_text in self._page_texts():
+                has_text = has_text or page_text != ""
 
+                page_labeled, page_answers = self._extract_fields(page_text)
 
+                for key, value in page_labeled.items():
+                    labeled.setdefault(key, value) # Only the first Race and Sex fields count
+                answers.extend(page_answers)
 
+                # All fields live on the first pages. Skip the rest, like appended bank statements
+                if self.fast and "race" in labeled and "sex" in labeled and len(answers) >= answer_count:
+                    break
+        except LoanApplicationParser.read_errors:
+            has_text = False
 
+        if has_text:
 
+            if "race" not in labeled or "sex" not in labeled:
+                raise ValueError("Race or Sex field is missing")
 
+            usr_data.update(labeled)
+            self._push_answers(usr_data, answers)
+            
+            return usr_data
+                    
+        
+        return {}
@@ -0,0 +1,105 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar, Union
+import pandas as pd
+from bot.loan_database import LoanDatabase, WriterBusyError
+from bot.loan_user import LoanUser
+from bot.applicant_record import ApplicantRecord
+
+T = TypeVar("T")
+
+
+class AsyncLoanDatabase(object):
+    """Awaitable facade over LoanDatabase. Blocking queries run in a thread pool sized like the connection pool,
+    so a slow MySQL server only delays the users whose data is being saved instead of the whole event loop
+    """
+
+    def __init__(self, db: LoanDatabase, workers: int = None, write_timeout: float = None) -> None:
+        """Construct an async facade
+
+        Args:
+            db (LoanDatabase): Database object connected MySQL Server
+            workers (int, optional): number of threads that run queries. Defaults to the size of the connection pool.
+            write_timeout (float, optional): seconds a user may wait for space in a full batch writer. Defaults to the timeout of the connection pool.
+        """
+
+        self.db = db
+        self.write_timeout = db.pool_timeout if write_timeout is None else write_timeout
+        self.executor = ThreadPoolExecutor(max_workers = workers or db.pool_size, thread_name_prefix = "loan-db")
+
+    async def _run(self, work: Callable[..., T], *args) -> T:
+        """Run a blocking call in the thread pool
+
+        Args:
+            work (Callable[..., T]): blocking function
+            *args: arguments of the function
+
+        Returns:
+            T: result of the function
+        """
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, work, *args)
+
+    async def execute(self, query: str, params: tuple = None) -> None:
+        """Execute MySQL query. See LoanDatabase.execute_query()
+
+        Args:
+            query (str): SQL query to be executed
+            params (tuple, optional): values for %s placeholders in the query. Defaults to None.
+        """
+
+        await self._run(self.db.execute_query, query, params)
+
+    async def read(self, query: str, params: tuple = None) -> list:
+        """Read from MySQL Server. See LoanDatabase.read_query()
+
+        Args:
+            query (str): MySQL query to be executed on a server
+            params (tuple, optional): values for %s placeholders in the query. Defaults to None.
+
+        Returns:
+            list: rows returned by the Server
+        """
+
+        return await self._run(self.db.read_query, query, params)
+
+    async def upsert_user(self, usr: LoanUser) -> int:
+        """Insert or replace data of a user. Goes through the batch writer of the database if it has one,
+        in which case the data is queued rather than written when this returns. See LoanDatabase.write_row() and LoanUser.dump_data_to_sql()
+
+        Args:
+            usr (LoanUser): user whose data is saved
+
+        Returns:
+            int: 1 if data has been uploaded or queued successfully; 0 otherwise
+        """
+
+        if self.db.writer is None:
+            return await self._run(usr.dump_data_to_sql, self.db)
+
+        try:
+            # Waits in a database thread while the writer is full. Bounded, so a server that is down can't hold every thread and .close()
+            await self._run(self.db.write_row, usr.record.to_row(), self.write_timeout)
+        except WriterBusyError:
+            return 0
+
+        return 1
+
+    async def fetch_user(self, usr: LoanUser, as_frame: bool = False) -> Union[ApplicantRecord, pd.DataFrame, None]:
+        """Read data of a user. See LoanUser.get_user_data()
+
+        Args:
+            usr (LoanUser): user whose data is read
+            as_frame (bool, optional): return a one-row pandas dataframe instead of a record. Defaults to False.
+
+        Returns:
+            Union[ApplicantRecord, pd.DataFrame, None]: user data or None if user doesn't exist
+        """
+
+        return await self._run(usr.get_user_data, self.db, as_frame)
+
+    def close(self) -> None:
+        """Wait for running queries and stop the threads
+        """
+
+        self.executor.shutdown(wait = True)
@@ -0,0 +1,286 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+##  Exceptions
+class WriterBusyError(Exception):
+    pass
+
+
+class BatchWriter(object):
+    """Buffers rows and writes them from a background thread in batches of up to batch_size rows, at least every flush_interval seconds.
+    The buffer is bounded: when it's full, .put() waits for the writer to catch up. With a journal, every row is appended to a local file
+    before it's buffered, and rows that haven't reached the database when the process stops are written again on the next start.
+    Writes must be idempotent, like upserts, because a replayed journal may repeat rows that have already been written.
+    Only transient errors are retried. A batch that fails otherwise is split until the rows that can't be written are found, and those rows
+    are set aside in a dead letter file instead of blocking every row after them
+    """
+
+    compact_bytes: int = 1 << 20 # Written part of the journal that is cut off even if some rows are still waiting
+
+    def __init__(self, write: Callable[[list], None], batch_size: int = 100, flush_interval: float = 0.5, max_queue: int = 10000,
+                 journal: str = None, retry_interval: float = 1, is_transient: Callable[[Exception], bool] = None, dead_letter: str = None) -> None:
+        """Start a batch writer. Rows left in the journal by a previous run are queued first
+
+        Args:
+            write (Callable[[list], None]): function that writes a list of rows in one batch
+            batch_size (int, optional): maximum number of rows per batch. Defaults to 100.
+            flush_interval (float, optional): maximum number of seconds a row waits in the buffer. Defaults to 0.5.
+            max_queue (int, optional): maximum number of buffered rows. Defaults to 10000.
+            journal (str, optional): path to the append-only journal. No journal if None. Defaults to None.
+            retry_interval (float, optional): seconds to wait before a failed batch is written again. Defaults to 1.
+            is_transient (Callable[[Exception], bool], optional): tells whether a failed write may succeed later. Every error is transient if None. Defaults to None.
+            dead_letter (str, optional): path to the file that receives rows that can't be written. Such rows are only logged if None. Defaults to None.
+        """
+
+        self.write = write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.journal = journal
+        self.is_transient = is_transient or (lambda err: True)
+        self.dead_letter = dead_letter
+
+        self.max_queue = max_queue
+        self.queue: queue.Queue = queue.Queue()
+        self._free = threading.Semaphore(max_queue) # Free space in the buffer. Taken by .put(), given back once a row has been written
+
+        self._lock = threading.Lock()
+        self._offsets: deque = deque() # End of each journaled row that hasn't been written yet, in the order of the queue
+        self._dropped: int = 0 # Rows of a batch that failed at shutdown
+        self._stopped = threading.Event()
+
+        self._journal_file = None
+        replayed: list = []
+
+        if journal is not None:
+            replayed = self._read_journal()
+            self._journal_file = open(journal, "a", encoding = "utf-8", newline = "")
+
+        self._thread = threading.Thread(target = self._run, name = "loan-batch-writer", daemon = True)
+        self._thread.start()
+
+        for row in replayed: # Queued while the writer runs, the journal may hold more rows than the buffer
+            self._free.acquire()
+            self.queue.put(row)
+
+    def _read_journal(self) -> list:
+        """Read rows of the journal left by the previous run. They stay in the journal until they are written
+
+        Returns:
+            list: rows to write again
+        """
+
+        rows: list = []
+
+        if not os.path.exists(self.journal):
+            return rows
+
+        offset = 0
+
+        with open(self.journal, "rb") as file:
+            for line in file:
+                if not line.endswith(b"\n"): # Last line cut short by a crash. Cut off, so new rows start on a line of their own
+                    break
+
+                offset += len(line)
+
+                if not line.strip():
+                    continue
+
+                try:
+                    row = tuple(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+
+                rows.append(row)
+                self._offsets.append(offset)
+
+        os.truncate(self.journal, offset)
+
+        return rows
+
+    def put(self, row: tuple, timeout: Optional[float] = None) -> None:
+        """Buffer a row. Waits while the buffer is full
+
+        Args:
+            row (tuple): row to write. Values must be JSON serializable if there is a journal
+            timeout (Optional[float], optional): maximum number of seconds to wait for free space. Waits as long as needed if None. Defaults to None.
+
+        Raises:
+            WriterBusyError: if the buffer is still full after timeout or the writer has been closed
+        """
+
+        if self._stopped.is_set():
+            raise WriterBusyError("Batch writer has been closed")
+
+        # Waits without the lock, so the writer can finish the batch that frees space
+        if not self._free.acquire(timeout = timeout):
+            raise WriterBusyError(f"There are already {self.max_queue} rows waiting to be written")
+
+        # The writer counts a written row under the same lock, so it never sees a row before it's journaled
+        with self._lock:
+            if self._journal_file is not None:
+                self._journal_file.write(json.dumps(row) + "\n")
+                self._journal_file.flush() # Survives a crash of the bot, not of the host
+                self._offsets.append(self._journal_file.tell())
+
+            self.queue.put(row)
+
+    def _next_batch(self) -> list:
+        """Collect rows until the batch is full or flush_interval has passed since the first one
+
+        Returns:
+            list: rows of the batch. Empty if no rows arrived
+        """
+
+        try:
+            batch = [self.queue.get(timeout = self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.batch_size and (remaining := deadline - time.monotonic()) > 0:
+            try:
+                batch.append(self.queue.get(timeout = remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _reject(self, row: tuple, err: Exception) -> None:
+        """Set aside a row that can't be written
+
+        Args:
+            row (tuple): rejected row
+            err (Exception): error of its write
+        """
+
+        logger.error("Row %s can't be written and has been rejected. Error: %s", row, err)
+
+        if self.dead_letter is None:
+            return
+
+        try:
+            with open(self.dead_letter, "a", encoding = "utf-8") as file:
+                file.write(json.dumps({"row": row, "error": str(err)}, default = str) + "\n")
+        except OSError as file_err:
+            logger.error("Couldn't write rejected row to %s. Error: %s", self.dead_letter, file_err)
+
+    def _write_batch(self, batch: list) -> bool:
+        """Write a batch. Transient errors are retried until the batch succeeds or the writer is closed. Any other error splits the batch
+        in halves until the rows that fail are found and rejected
+
+        Args:
+            batch (list): rows to write
+
+        Returns:
+            bool: True if every row has been written or rejected
+        """
+
+        parts = [batch] # Parts left to write, the next one last
+
+        while parts:
+            rows = parts.pop()
+
+            try:
+                self.write(rows)
+                continue
+            except Exception as err:
+                if not self.is_transient(err):
+                    if len(rows) == 1:
+                        self._reject(rows[0], err)
+                    else:
+                        parts.extend([rows[len(rows) // 2:], rows[:len(rows) // 2]])
+                    continue
+
+                if self._stopped.is_set():
+                    self._dropped = len(rows) + sum(len(part) for part in parts)
+                    logger.error("Couldn't write %d rows before shutdown. Error: %s", self._dropped, err)
+                    return False
+
+                logger.warning("Couldn't write %d rows, will retry. Error: %s", len(rows), err)
+                parts.append(rows)
+                self._stopped.wait(self.retry_interval) # Full buffer makes new rows wait meanwhile
+
+        return True
+
+    def _compact(self, written: int) -> None:
+        """Cut the written part off the journal. Must be called with the lock held
+
+        Args:
+            written (int): size of the written part in bytes
+        """
+
+        if not self._offsets: # Every journaled row has been written
+            self._journal_file.truncate(0)
+            return
+
+        if written < BatchWriter.compact_bytes:
+            return
+
+        # Waiting rows are copied to a new journal that replaces the old one in a single step
+        self._journal_file.close()
+
+        with open(self.journal, "rb") as file:
+            file.seek(written)
+            waiting = file.read()
+
+        with open(self.journal + ".tmp", "wb") as file:
+            file.write(waiting)
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(self.journal + ".tmp", self.journal)
+
+        self._journal_file = open(self.journal, "a", encoding = "utf-8", newline = "")
+        self._offsets = deque(offset - written for offset in self._offsets)
+
+    def _run(self) -> None:
+        """Background thread. Writes batches until the writer is closed and the buffer is empty
+        """
+
+        while not (self._stopped.is_set() and self.queue.empty()):
+            if not (batch := self._next_batch()):
+                continue
+
+            if not self._write_batch(batch):
+                return # Rows that weren't written stay in the journal
+
+            for _ in range(len(batch)):
+                self._free.release()
+
+            if self._journal_file is None:
+                continue
+
+            with self._lock:
+                # Rows are written in journal order, so the written rows are the start of the journal
+                for _ in range(len(batch)):
+                    written = self._offsets.popleft()
+
+                self._compact(written)
+
+    def close(self) -> None:
+        """Write all buffered rows and stop the background thread
+        """
+
+        self._stopped.set()
+        self._thread.join()
+
+        if self._journal_file is not None:
+            self._journal_file.close()
+
+        if (unwritten := self.queue.qsize() + self._dropped) > 0:
+            logger.error("%d rows haven't been written%s", unwritten, f" and remain in {self.journal}" if self.journal else "")
+
+    def __len__(self) -> int:
+        return self.queue.qsize()
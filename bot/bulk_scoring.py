@@ -0,0 +1,255 @@
+import itertools
+import os
+import pandas as pd
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional, Tuple
+from bot.loan_predictor import LoanPredictor
+from bot.model_registry import ModelRegistry
+
+
+def _load_models() -> None:
+    """Worker initializer. Loads models once per worker process instead of once per chunk. Compiled models are memory-mapped,
+    so workers share a single copy of them
+    """
+
+    ModelRegistry.shared().get()
+
+
+# Errors of applicants that can't be scored, like categories unknown to the models or values that aren't numbers
+scoring_errors: tuple = (ValueError, TypeError)
+
+
+def _score_chunk(chunk: pd.DataFrame, theta_rate: float, weight_normalization: float) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Score a chunk of applicants in a worker process. If the chunk can't be scored at once, it's split in halves until the applicants
+    that fail are found, so they don't take the rest of the chunk down with them
+
+    Args:
+        chunk (pd.DataFrame): applicant data. See LoanPredictor.predict_batch()
+        theta_rate (float): minimum profit rate of the loan issuer
+        weight_normalization (float): interest rate weight normalization
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: applicant data with "income", "chance_of_default" and "interest_rate" columns,
+        and applicants that couldn't be scored with an "error" column. Both in input order
+    """
+
+    scored: list = []
+    failed: list = []
+    parts = [chunk] # Parts left to score, the next one last
+
+    while parts:
+        rows = parts.pop()
+
+        try:
+            scores = LoanPredictor.predict_batch(rows, theta_rate, weight_normalization)
+        except scoring_errors as err:
+            if len(rows) == 1:
+                failed.append(rows.assign(error = str(err)))
+            else:
+                parts.extend([rows.iloc[len(rows) // 2:], rows.iloc[:len(rows) // 2]])
+            continue
+
+        scored.append(rows.assign(**{col: scores[col] for col in scores.columns}))
+
+    return (pd.concat(scored) if scored else chunk.iloc[:0]), (pd.concat(failed) if failed else chunk.iloc[:0].assign(error = ""))
+
+
+class BulkScorer(object):
+    """Scores a file of applicants outside of the bot. The input is read in chunks, every chunk is scored in one vectorized call
+    in a pool of worker processes, and results are appended to the output in input order as soon as they are ready.
+    Applicants that can't be scored are written to a separate CSV file with the reason instead of stopping the whole file.
+    Supports CSV and Parquet files
+    """
+
+    formats: tuple = ("csv", "parquet")
+
+    # Input columns used by either model. Income is predicted
+    required_columns: list = list(dict.fromkeys(col for col in LoanPredictor.salary_columns + LoanPredictor.risk_columns if col != "income"))
+
+    def __init__(self, workers: int = None, chunk_size: int = 50000, theta_rate: float = 0, weight_normalization: float = 0) -> None:
+        """Construct a scorer
+
+        Args:
+            workers (int, optional): number of worker processes. Chunks are scored in this process if 0. Defaults to the number of CPUs.
+            chunk_size (int, optional): number of applicants read and scored at once. Defaults to 50000.
+            theta_rate (float, optional): minimum profit rate of the loan issuer. See LoanPredictor._get_interest_rate(). Defaults to 0.
+            weight_normalization (float, optional): interest rate weight normalization. Defaults to 0.
+        """
+
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.chunk_size = chunk_size
+        self.theta_rate = theta_rate
+        self.weight_normalization = weight_normalization
+
+    @staticmethod
+    def _format(path: str, file_format: Optional[str] = None) -> str:
+        """Format of a file
+
+        Args:
+            path (str): path to the file
+            file_format (Optional[str], optional): explicit format. Taken from the file extension if None. Defaults to None.
+
+        Raises:
+            ValueError: if the format is unknown
+
+        Returns:
+            str: "csv" or "parquet"
+        """
+
+        file_format = file_format or path.rsplit(".", 1)[-1].lower()
+
+        if file_format not in BulkScorer.formats:
+            raise ValueError(f"Unknown file format: {file_format}. Expected one of {', '.join(BulkScorer.formats)}")
+
+        return file_format
+
+    def _read_chunks(self, path: str, file_format: str) -> Iterator[pd.DataFrame]:
+        """Read applicants chunk by chunk
+
+        Args:
+            path (str): path to the input file
+            file_format (str): "csv" or "parquet"
+
+        Yields:
+            pd.DataFrame: up to chunk_size applicants
+        """
+
+        if file_format == "csv":
+            yield from pd.read_csv(path, chunksize = self.chunk_size)
+            return
+
+        import pyarrow.parquet as pq # Only needed for Parquet files
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size = self.chunk_size):
+            yield batch.to_pandas()
+
+    def score(self, in_path: str, out_path: str, in_format: Optional[str] = None, out_format: Optional[str] = None,
+              errors_path: Optional[str] = None) -> Tuple[int, int]:
+        """Score every applicant of a file
+
+        Args:
+            in_path (str): path to the applicants
+            out_path (str): path to the scored applicants
+            in_format (Optional[str], optional): "csv" or "parquet". Taken from the file extension if None. Defaults to None.
+            out_format (Optional[str], optional): "csv" or "parquet". Taken from the file extension if None. Defaults to None.
+            errors_path (Optional[str], optional): path to the CSV file of applicants that couldn't be scored. Only created if there are any.
+            Defaults to out_path with ".errors.csv" appended.
+
+        Raises:
+            ValueError: if a format is unknown or the input lacks a column used by the models
+
+        Returns:
+            Tuple[int, int]: number of scored applicants and number of applicants that couldn't be scored
+        """
+
+        errors_path = errors_path or out_path + ".errors.csv"
+
+        chunks = self._read_chunks(in_path, BulkScorer._format(in_path, in_format))
+        out_format = BulkScorer._format(out_path, out_format)
+
+        # Checked on the first chunk, before any output is written. Every chunk of a file has the same columns
+        if (first := next(chunks, None)) is None:
+            return 0, 0
+
+        if missing := [col for col in BulkScorer.required_columns if col not in first.columns]:
+            raise ValueError(f"{in_path} is missing columns used by the models: {', '.join(missing)}")
+
+        chunks = itertools.chain([first], chunks)
+        writer = _ChunkWriter(out_path, out_format)
+        errors = _ChunkWriter(errors_path, "csv")
+        scored = 0
+        failed = 0
+
+        if os.path.exists(errors_path): # Left by an earlier run, would be mistaken for failures of this one
+            os.remove(errors_path)
+
+        def write(result: Tuple[pd.DataFrame, pd.DataFrame]) -> None:
+            nonlocal scored, failed
+
+            if len(result[0]):
+                scored += writer.write(result[0])
+
+            if len(result[1]):
+                failed += errors.write(result[1])
+
+        try:
+            if self.workers == 0:
+                for chunk in chunks:
+                    write(_score_chunk(chunk, self.theta_rate, self.weight_normalization))
+
+                return scored, failed
+
+            with ProcessPoolExecutor(max_workers = self.workers, initializer = _load_models) as executor:
+                pending: deque = deque() # Chunks being scored, in input order
+
+                for chunk in chunks:
+                    pending.append(executor.submit(_score_chunk, chunk, self.theta_rate, self.weight_normalization))
+
+                    # Two chunks per worker keep every worker busy while bounding memory
+                    if len(pending) >= 2 * self.workers:
+                        write(pending.popleft().result())
+
+                while pending:
+                    write(pending.popleft().result())
+        finally:
+            writer.close()
+            errors.close()
+
+        return scored, failed
+
+
+class _ChunkWriter(object):
+    """Appends scored chunks to a CSV or Parquet file
+    """
+
+    def __init__(self, path: str, file_format: str) -> None:
+        """Construct a writer. The file is created with the first chunk
+
+        Args:
+            path (str): path to the output file
+            file_format (str): "csv" or "parquet"
+        """
+
+        self.path = path
+        self.file_format = file_format
+
+        self._parquet_writer = None
+        self._schema = None
+        self._header_written = False
+
+    def write(self, chunk: pd.DataFrame) -> int:
+        """Append a chunk
+
+        Args:
+            chunk (pd.DataFrame): scored applicants
+
+        Returns:
+            int: number of written rows
+        """
+
+        if self.file_format == "csv":
+            chunk.to_csv(self.path, mode = "a" if self._header_written else "w", header = not self._header_written, index = False)
+            self._header_written = True
+            return len(chunk)
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._parquet_writer is None:
+            table = pa.Table.from_pandas(chunk, preserve_index = False)
+            self._schema = table.schema
+            self._parquet_writer = pq.ParquetWriter(self.path, self._schema)
+        else:
+            table = pa.Table.from_pandas(chunk, schema = self._schema, preserve_index = False) # Types of the first chunk win
+
+        self._parquet_writer.write_table(table)
+
+        return len(chunk)
+
+    def close(self) -> None:
+        """Finish the output file
+        """
+
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
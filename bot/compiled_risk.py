@@ -0,0 +1,142 @@
+import numpy as np
+from typing import List
+from bot.ordinal_encoding import OrdinalLookup
+from bot.model_artifact import ModelArtifact
+
+
+class CompiledRiskModel(object):
+    """Risk model compiled to plain NumPy. Ordinal encoding, PCA rotation (x - mean) @ components.T and the logistic regression
+    are folded into one weight vector: numerical features are multiplied by their weights and every categorical feature is replaced by a precomputed
+    contribution from its lookup table.
+    """
+
+    def __init__(self, numeric_columns: List[str], numeric_weights: np.ndarray, categorical_columns: List[str], categories: List[np.ndarray],
+                 contributions: List[np.ndarray], bias: float) -> None:
+        """Construct a compiled risk model. See .from_sklearn()
+
+        Args:
+            numeric_columns (List[str]): names of numerical features
+            numeric_weights (np.ndarray): weight of each numerical feature
+            categorical_columns (List[str]): names of categorical features
+            categories (List[np.ndarray]): sorted categories of each categorical feature
+            contributions (List[np.ndarray]): contribution of each category of each categorical feature to the decision function
+            bias (float): intercept of the decision function
+        """
+
+        self.numeric_columns: List[str] = list(numeric_columns)
+        self.numeric_weights: np.ndarray = np.ascontiguousarray(numeric_weights, dtype = np.float64)
+        self.categorical_columns: List[str] = list(categorical_columns)
+        self.lookups: List[OrdinalLookup] = [OrdinalLookup(column_categories) for column_categories in categories]
+        self.contributions: List[np.ndarray] = [np.ascontiguousarray(table, dtype = np.float64) for table in contributions]
+        self.bias: float = float(bias)
+
+    @classmethod
+    def from_sklearn(cls, model: object, pca_components: np.ndarray, pca_mean: np.ndarray, categories: List[np.ndarray],
+                     columns: List[str], categorical_columns: List[str]) -> "CompiledRiskModel":
+        """Fold a fitted risk pipeline into a compiled model
+
+        Args:
+            model (object): fitted binary LogisticRegression trained on the first n principal components
+            pca_components (np.ndarray): components_ of the fitted PCA
+            pca_mean (np.ndarray): mean_ of the fitted PCA
+            categories (List[np.ndarray]): categories_ of the fitted OrdinalEncoder
+            columns (List[str]): names of all features in the order used for training
+            categorical_columns (List[str]): names of categorical features in the order used by the encoder
+
+        Returns:
+            CompiledRiskModel: compiled model
+        """
+
+        coefficients = np.asarray(model.coef_, dtype = np.float64)[0]
+        components = np.asarray(pca_components, dtype = np.float64)[: len(coefficients)]
+
+        # decision(x) = ((x - mean) @ components.T) @ coef + intercept = x @ weights + bias
+        weights = components.T @ coefficients
+        bias = float(np.asarray(model.intercept_)[0]) - float(np.asarray(pca_mean, dtype = np.float64) @ weights)
+
+        weight_of = dict(zip(columns, weights))
+        numeric_columns = [column for column in columns if column not in categorical_columns]
+
+        return cls(
+            numeric_columns = numeric_columns,
+            numeric_weights = np.array([weight_of[column] for column in numeric_columns]),
+            categorical_columns = categorical_columns,
+            categories = categories,
+            contributions = [np.arange(len(column_categories)) * weight_of[column] for column, column_categories in zip(categorical_columns, categories)],
+            bias = bias
+        )
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "CompiledRiskModel":
+        """Load a compiled model saved with .save()
+
+        Args:
+            directory (str): directory of the artifact
+            mmap (bool, optional): memory-map arrays so processes on one host share them. Defaults to True.
+
+        Returns:
+            CompiledRiskModel: compiled model
+        """
+
+        artifact = ModelArtifact.load(directory, kind = "compiled_risk", mmap = mmap)
+        categorical_columns = artifact.metadata["categorical_columns"]
+
+        return cls(
+            numeric_columns = artifact.metadata["numeric_columns"],
+            numeric_weights = artifact.arrays["numeric_weights"],
+            categorical_columns = categorical_columns,
+            categories = artifact.metadata["categories"],
+            contributions = [artifact.arrays[f"contributions_{index}"] for index in range(len(categorical_columns))],
+            bias = artifact.metadata["bias"]
+        )
+
+    def save(self, directory: str) -> None:
+        """Save this model as a memory-mappable artifact. Loading it requires NumPy only. See ModelArtifact
+
+        Args:
+            directory (str): directory of the artifact
+        """
+
+        arrays = {"numeric_weights": self.numeric_weights}
+
+        for index, table in enumerate(self.contributions):
+            arrays[f"contributions_{index}"] = table
+
+        metadata = {
+            "numeric_columns": self.numeric_columns,
+            "categorical_columns": self.categorical_columns,
+            "categories": [lookup.categories.tolist() for lookup in self.lookups],
+            "bias": self.bias
+        }
+
+        ModelArtifact("compiled_risk", arrays, metadata).save(directory)
+
+    def decision_function(self, risk_data) -> np.ndarray:
+        """Calculate the decision function of the logistic regression
+
+        Args:
+            risk_data (pd.DataFrame): risk model features. Any mapping of column name to values works
+
+        Returns:
+            np.ndarray: decision function for each applicant
+        """
+
+        numeric = np.column_stack([np.asarray(risk_data[column], dtype = np.float64) for column in self.numeric_columns])
+        decision = numeric @ self.numeric_weights + self.bias
+
+        for column, lookup, table in zip(self.categorical_columns, self.lookups, self.contributions):
+            decision += table[lookup.transform(risk_data[column])]
+
+        return decision
+
+    def predict_default(self, risk_data) -> np.ndarray:
+        """Predict the likelyhood of defaulting on a loan
+
+        Args:
+            risk_data (pd.DataFrame): risk model features. Any mapping of column name to values works
+
+        Returns:
+            np.ndarray: likelyhood of defaulting on a loan for each applicant [0, 1]
+        """
+
+        return np.exp(-np.logaddexp(0, -self.decision_function(risk_data))) # Numerically stable logistic function
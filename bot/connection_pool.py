@@ -0,0 +1,251 @@
+import mysql.connector
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+##  Exceptions
+class PoolTimeoutError(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    """Thread-safe pool of MySQL connections. Connections are pinged before they are handed out, and connections lost to the server
+    (for example after MySQL's idle wait_timeout) are replaced instead of failing every later query
+    """
+
+    # MySQL client errors of a dead connection: server has gone away, lost connection during query, lost connection (extended)
+    reconnect_errors: frozenset = frozenset({2006, 2013, 2055})
+
+    # MySQL client errors of a server that can't be reached: can't connect through the socket, can't connect to the host
+    connect_errors: frozenset = frozenset({2002, 2003})
+
+    def __init__(self, connect: Callable[[], "mysql.connector.MySQLConnection"], min_size: int = 1, max_size: int = 8, timeout: float = 10,
+                 pre_ping: bool = True) -> None:
+        """Construct a pool and open min_size connections right away
+
+        Args:
+            connect (Callable[[], MySQLConnection]): function that opens a new connection
+            min_size (int, optional): number of connections opened up front. Defaults to 1.
+            max_size (int, optional): maximum number of open connections. Defaults to 8.
+            timeout (float, optional): seconds to wait for a free connection when all of them are checked out. Defaults to 10.
+            pre_ping (bool, optional): check that a connection is alive before handing it out. Defaults to True.
+        """
+
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError(f"Pool size must satisfy 0 <= min_size <= max_size and max_size >= 1, got {min_size} and {max_size}")
+
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+
+        self._idle: queue.LifoQueue = queue.LifoQueue() # The most recently used connection is the least likely to have timed out
+        self._lock = threading.Lock()
+        self._size: int = 0 # Open connections, both idle and checked out
+
+        for _ in range(min_size):
+            self._reserve()
+            self._idle.put(self._open())
+
+    def _reserve(self) -> bool:
+        """Count a connection that is about to be opened, unless the pool is full
+
+        Returns:
+            bool: True if there was room for another connection
+        """
+
+        with self._lock:
+            if self._size >= self.max_size:
+                return False
+
+            self._size += 1
+
+        return True
+
+    def _open(self) -> "mysql.connector.MySQLConnection":
+        """Open a new connection in a slot taken with ._reserve(). The slot is given back if the connection can't be opened
+
+        Raises:
+            mysql.connector.Error: if the server can't be reached
+
+        Returns:
+            MySQLConnection: new connection
+        """
+
+        try:
+            return self.connect()
+        except BaseException:
+            with self._lock:
+                self._size -= 1
+            raise
+
+    def _is_alive(self, connection: "mysql.connector.MySQLConnection") -> bool:
+        """Ping a connection and try to reconnect it once if it's dead
+
+        Args:
+            connection (MySQLConnection): connection to check
+
+        Returns:
+            bool: True if the connection can be used
+        """
+
+        try:
+            connection.ping(reconnect = True, attempts = 1, delay = 0)
+        except mysql.connector.Error:
+            return False
+
+        return True
+
+    def acquire(self, timeout: float = None) -> "mysql.connector.MySQLConnection":
+        """Check out a connection. Opens a new one if all connections are busy and the pool isn't full
+
+        Args:
+            timeout (float, optional): seconds to wait for a free connection. Defaults to the timeout of the pool.
+
+        Raises:
+            PoolTimeoutError: if no connection became free in time
+
+        Returns:
+            MySQLConnection: connection that must be given back with .release() or .discard()
+        """
+
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            if self._reserve():
+                return self._open()
+
+            try:
+                connection = self._idle.get(timeout = self.timeout if timeout is None else timeout)
+            except queue.Empty:
+                raise PoolTimeoutError(f"No database connection became free within {self.timeout if timeout is None else timeout} seconds")
+
+        if self.pre_ping and not self._is_alive(connection):
+            self._close(connection) # The new connection takes over its slot
+            return self._open()
+
+        return connection
+
+    def release(self, connection: "mysql.connector.MySQLConnection") -> None:
+        """Give a connection back to the pool. Uncommitted changes are rolled back
+
+        Args:
+            connection (MySQLConnection): connection checked out with .acquire()
+        """
+
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except mysql.connector.Error:
+            self.discard(connection)
+            return
+
+        self._idle.put(connection)
+
+    def discard(self, connection: "mysql.connector.MySQLConnection") -> None:
+        """Close a broken connection instead of giving it back to the pool
+
+        Args:
+            connection (MySQLConnection): connection checked out with .acquire()
+        """
+
+        with self._lock:
+            self._size -= 1
+
+        self._close(connection)
+
+    @staticmethod
+    def _close(connection: "mysql.connector.MySQLConnection") -> None:
+        """Close a connection, ignoring errors of a connection that is already dead
+
+        Args:
+            connection (MySQLConnection): connection to close
+        """
+
+        try:
+            connection.close()
+        except mysql.connector.Error:
+            pass
+
+    @contextmanager
+    def connection(self, timeout: float = None) -> Iterator["mysql.connector.MySQLConnection"]:
+        """Check out a connection for the duration of a with block. Connections lost to the server are discarded
+
+        Args:
+            timeout (float, optional): seconds to wait for a free connection. Defaults to the timeout of the pool.
+
+        Yields:
+            MySQLConnection: checked out connection
+        """
+
+        connection = self.acquire(timeout)
+
+        try:
+            yield connection
+        except mysql.connector.Error as err:
+            if err.errno in ConnectionPool.reconnect_errors:
+                self.discard(connection)
+            else:
+                self.release(connection)
+            raise
+        except BaseException:
+            self.release(connection)
+            raise
+        else:
+            self.release(connection)
+
+    def run(self, work: Callable[["mysql.connector.MySQLConnection"], T]) -> T:
+        """Run a unit of work on a pooled connection. If the server went away in the middle, it's retried once on a fresh connection
+
+        Args:
+            work (Callable[[MySQLConnection], T]): function that uses the connection. Must commit its own changes
+
+        Returns:
+            T: result of the work
+        """
+
+        try:
+            with self.connection() as connection:
+                return work(connection)
+        except mysql.connector.Error as err:
+            if err.errno not in ConnectionPool.reconnect_errors:
+                raise
+
+        with self.connection() as connection:
+            return work(connection)
+
+    @staticmethod
+    def is_connection_error(err: Exception) -> bool:
+        """Tells whether an error comes from the connection rather than the query, so the same query may succeed later
+
+        Args:
+            err (Exception): error raised by a query
+
+        Returns:
+            bool: True if the server couldn't be reached or no connection became free
+        """
+
+        if isinstance(err, PoolTimeoutError):
+            return True
+
+        return isinstance(err, mysql.connector.Error) and err.errno in ConnectionPool.reconnect_errors | ConnectionPool.connect_errors
+
+    def close(self) -> None:
+        """Close all idle connections. Connections that are checked out are closed when they are discarded
+        """
+
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return
+
+            self.discard(connection)
+
+    def __len__(self) -> int:
+        return self._size
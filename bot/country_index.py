@@ -0,0 +1,112 @@
+import numpy as np
+import csv
+import os
+
+
+class DevelopedCountryIndex(object):
+    """Immutable index of developed countries. Countries are classified by the Human Development Index (HDI);
+    HDI of 0.80 and above is classified as "developed". Uses the same spelling rules as models/salary_model.py
+    """
+
+    hdi_threshold: float = 0.8 # HDI at which a country is considered developed
+
+    def __init__(self, countries) -> None:
+        """Construct an index from country names
+
+        Args:
+            countries (Iterable[str]): names of developed countries
+        """
+
+        self.countries: frozenset = frozenset(DevelopedCountryIndex.normalize(country) for country in countries)
+
+    @staticmethod
+    def normalize(country: str) -> str:
+        """Match the spelling style of the salary dataset. Removes white spaces around the name and replaces spaces between words with "-"
+
+        Args:
+            country (str): name of the country
+
+        Returns:
+            str: normalized name of the country
+        """
+
+        return str(country).strip().replace(" ", "-")
+
+    @classmethod
+    def from_csv(cls, file_name: str) -> "DevelopedCountryIndex":
+        """Build an index from HDI dataset
+
+        Args:
+            file_name (str): path to the HDI dataset. Must include "country" and "hdi2019" columns
+
+        Returns:
+            DevelopedCountryIndex: index of developed countries
+        """
+
+        with open(file_name, newline = "", encoding = "utf-8-sig") as file:
+            countries = [row["country"] for row in csv.DictReader(file) if float(row["hdi2019"]) >= cls.hdi_threshold]
+
+        return cls(countries)
+
+    @classmethod
+    def load(cls, file_name: str) -> "DevelopedCountryIndex":
+        """Load an index saved with .save()
+
+        Args:
+            file_name (str): path to the .npy file
+
+        Returns:
+            DevelopedCountryIndex: index of developed countries
+        """
+
+        return cls(np.load(file_name).tolist())
+
+    @classmethod
+    def load_or_build(cls, index_file: str, hdi_file: str) -> "DevelopedCountryIndex":
+        """Load a precomputed index if it exists, otherwise build it from HDI dataset
+
+        Args:
+            index_file (str): path to the precomputed .npy index
+            hdi_file (str): path to the HDI dataset
+
+        Returns:
+            DevelopedCountryIndex: index of developed countries
+        """
+
+        if os.path.exists(index_file):
+            return cls.load(index_file)
+
+        return cls.from_csv(hdi_file)
+
+    def save(self, file_name: str) -> None:
+        """Save this index as a small .npy array of country names
+
+        Args:
+            file_name (str): path to the .npy file
+        """
+
+        np.save(file_name, np.array(sorted(self.countries), dtype = str))
+
+    def is_developed(self, country: str) -> bool:
+        """Checks whether a country is developed
+
+        Args:
+            country (str): name of the country
+
+        Returns:
+            bool: True if this country is developed. False otherwise
+        """
+
+        return DevelopedCountryIndex.normalize(country) in self.countries
+
+    def classify(self, country: str) -> str:
+        """Change native country to binary classification
+
+        Args:
+            country (str): name of the country
+
+        Returns:
+            str: "developed" or "developing"
+        """
+
+        return "developed" if self.is_developed(country) else "developing"
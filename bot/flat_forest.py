@@ -0,0 +1,177 @@
+import numpy as np
+from bot.model_artifact import ModelArtifact
+
+
+class FlatForest(object):
+    """Random forest classifier flattened into contiguous NumPy arrays. Nodes of all trees are stored one after another,
+    so a batch of rows traverses every tree at once instead of dispatching tree by tree. Supports binary classifiers only
+    """
+
+    max_cells: int = 2 ** 22 # Maximum number of (row, tree) pairs traversed at once. Bigger batches are split into chunks
+    block_pairs: int = 2 ** 16 # (row, tree) pairs stepped together. Small enough for their temporary arrays to stay in CPU cache
+    compact_steps: int = 4 # Steps between dropping pairs that reached a leaf. Dropping them every step costs more than stepping them
+
+    def __init__(self, roots: np.ndarray, feature: np.ndarray, threshold: np.ndarray, children: np.ndarray, value: np.ndarray,
+                 classes: np.ndarray, max_depth: int) -> None:
+        """Construct a flattened forest. See .from_sklearn()
+
+        Args:
+            roots (np.ndarray): index of the root node of each tree
+            feature (np.ndarray): feature used to split each node
+            threshold (np.ndarray): threshold used to split each node. Rows with feature <= threshold go left
+            children (np.ndarray): (n_nodes, 2) indices of the left and the right child of each node. Leaves point to themselves
+            value (np.ndarray): probability of the second class in each node
+            classes (np.ndarray): class labels
+            max_depth (int): depth of the deepest tree
+        """
+
+        # Plain views of memory-mapped arrays. Indexing a np.memmap wraps every result in a memmap, which is slow in tight loops
+        self.roots = np.asarray(roots)
+        self.feature = np.asarray(feature)
+        self.threshold = np.asarray(threshold)
+        self.children = np.asarray(children)
+        self.value = np.asarray(value)
+        self.classes = np.asarray(classes)
+        self.max_depth = int(max_depth)
+
+    @classmethod
+    def from_sklearn(cls, forest: object) -> "FlatForest":
+        """Flatten a fitted sklearn random forest
+
+        Args:
+            forest (object): fitted binary RandomForestClassifier
+
+        Returns:
+            FlatForest: flattened forest
+        """
+
+        roots, feature, threshold, children, value = [], [], [], [], []
+        offset = 0
+
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+
+            # Leaves point to themselves, so extra traversal steps of shallow trees don't move them
+            roots.append(offset)
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, 0, tree.threshold))
+            children.append(np.column_stack([np.where(is_leaf, nodes, tree.children_left), np.where(is_leaf, nodes, tree.children_right)]) + offset)
+
+            counts = tree.value[:, 0, :]
+            value.append(counts[:, 1] / counts.sum(axis = 1)) # Same probability as DecisionTreeClassifier.predict_proba
+
+            offset += tree.node_count
+
+        return cls(
+            roots = np.array(roots, dtype = np.int32),
+            feature = np.concatenate(feature).astype(np.int16),
+            threshold = np.concatenate(threshold).astype(np.float64),
+            children = np.concatenate(children).astype(np.int32), # Both children of a node share a cache line
+            value = np.concatenate(value).astype(np.float64),
+            classes = np.asarray(forest.classes_),
+            max_depth = max(estimator.tree_.max_depth for estimator in forest.estimators_)
+        )
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "FlatForest":
+        """Load a forest saved with .save()
+
+        Args:
+            directory (str): directory of the artifact
+            mmap (bool, optional): memory-map arrays so processes on one host share them. Defaults to True.
+
+        Returns:
+            FlatForest: flattened forest
+        """
+
+        artifact = ModelArtifact.load(directory, kind = "flat_forest", mmap = mmap)
+        arrays = dict(artifact.arrays)
+
+        if "children" not in arrays: # Saved with separate left and right arrays. Combined in a private copy until compiled again
+            arrays["children"] = np.column_stack([arrays.pop("left"), arrays.pop("right")])
+
+        return cls(max_depth = artifact.metadata["max_depth"], **arrays)
+
+    def save(self, directory: str) -> None:
+        """Save this forest as a memory-mappable artifact. See ModelArtifact
+
+        Args:
+            directory (str): directory of the artifact
+        """
+
+        arrays = {"roots": self.roots, "feature": self.feature, "threshold": self.threshold, "children": self.children, "value": self.value,
+            "classes": self.classes}
+
+        ModelArtifact("flat_forest", arrays, {"max_depth": self.max_depth}).save(directory)
+
+    def _traverse(self, X: np.ndarray) -> np.ndarray:
+        """Find a leaf of every tree for every row. (row, tree) pairs are stepped in blocks in tree-major order, so consecutive lookups
+        stay within the nodes of one tree, and pairs that reached a leaf are dropped, so the work follows the depth of the actual paths
+        instead of max_depth for every pair
+
+        Args:
+            X (np.ndarray): (n_rows, n_features) float32 matrix
+
+        Returns:
+            np.ndarray: (n_rows, n_trees) leaf indices
+        """
+
+        n_rows = len(X)
+        columns = np.ascontiguousarray(X.T).ravel() # Flat lookups by feature * n_rows + row are cheaper than 2D fancy indexing
+        leaves = np.repeat(self.roots, n_rows)
+
+        for start in range(0, len(leaves), self.block_pairs):
+            pairs = np.arange(start, min(start + self.block_pairs, len(leaves)))
+            rows = pairs % n_rows
+            nodes = leaves[pairs]
+
+            for step in range(1, self.max_depth + 1): # Every pair is in a leaf after max_depth steps
+                go_right = ~(columns[self.feature[nodes].astype(np.intp) * n_rows + rows] <= self.threshold[nodes])
+                nodes = self.children[nodes, go_right.view(np.int8)] # Leaves point to themselves, extra steps don't move them
+
+                if step % self.compact_steps == 0:
+                    done = self.children[nodes, 0] == nodes
+
+                    leaves[pairs[done]] = nodes[done]
+                    pairs, rows, nodes = pairs[~done], rows[~done], nodes[~done]
+
+                    if not len(pairs):
+                        break
+
+            leaves[pairs] = nodes
+
+        return leaves.reshape(len(self.roots), n_rows).T
+
+    def predict_proba(self, X) -> np.ndarray:
+        """Predict class probabilities. Matches RandomForestClassifier.predict_proba
+
+        Args:
+            X (array-like): (n_rows, n_features) feature matrix
+
+        Returns:
+            np.ndarray: (n_rows, 2) class probabilities
+        """
+
+        X = np.asarray(X, dtype = np.float32) # sklearn trees compare float32 features against float64 thresholds
+
+        probability = np.empty(len(X), dtype = np.float64)
+        chunk_size = max(1, self.max_cells // len(self.roots))
+
+        for start in range(0, len(X), chunk_size):
+            probability[start: start + chunk_size] = self.value[self._traverse(X[start: start + chunk_size])].mean(axis = 1)
+
+        return np.column_stack([1 - probability, probability])
+
+    def predict(self, X) -> np.ndarray:
+        """Predict class labels. Matches RandomForestClassifier.predict
+
+        Args:
+            X (array-like): (n_rows, n_features) feature matrix
+
+        Returns:
+            np.ndarray: predicted class of each row
+        """
+
+        return self.classes[np.argmax(self.predict_proba(X), axis = 1)]
@@ -1,4 +1,5 @@
 
+import asyncio
 import requests
 import discord
 import regex as re
@@ -12,6 +13,12 @@ from discord.ext import commands
 from bot.loan_user import *
 from bot.application_parser import *
 from bot.loan_predictor import *
+from bot.model_registry import *
+from bot.parse_pool import *
+from bot.parse_cache import *
+from bot.session_manager import *
+from bot.session_store import *
+from bot.async_database import *
 
 
 class LoanBot(commands.Bot):
@@ -21,7 +28,16 @@ class LoanBot(commands.Bot):
         Bot (discord.ext.command)
     """
 
-    def __init__(self, username: str, hostname: str, password: str, normalization: float) -> None:
+    completed_stage: int = 4 # Stage of a user after the last interaction. See respond_to_user()
+    max_loan_amount: int = 1000000000 # Largest loan amount accepted from a user. Must fit the INT UNSIGNED loan_amount column
+
+    def __init__(self, username: str, hostname: str, password: str, normalization: float, parser_workers: int = 2, parser_queue: int = 16,
+                 parser_timeout: float = 30, parser_fast: bool = True, parser_raw_text: bool = False, parser_cache_size: int = 256,
+                 parser_cache_dir: str = None, parser_cache_ttl: float = 86400, session_timeout: float = 1800, session_store: str = "memory", session_path: str = "sessions.db",
+                 session_batch_size: int = 64, session_flush_interval: float = 0.5, db_pool_min_size: int = 1, db_pool_size: int = 8,
+                 db_pool_timeout: float = 10, db_pre_ping: bool = True, db_batch_size: int = 100, db_flush_interval: float = 0.5,
+                 db_max_queue: int = 10000, db_journal: str = None, db_user_cache_size: int = 1024, db_user_cache_ttl: float = 60,
+                 prediction_cache_size: int = 4096) -> None:
         """Main constructor for the Loan Bot. All commands are prefixed with '/'
 
         Args:
@@ -29,16 +45,57 @@ class LoanBot(commands.Bot):
             hostname (str): MySQL hostname
             password (str): MySQL password
             normalization (float): interest rate weight normalization
+            parser_workers (int, optional): number of processes that parse loan applications. Defaults to 2.
+            parser_queue (int, optional): maximum number of applications that are being parsed at once. Defaults to 16.
+            parser_timeout (float, optional): seconds to wait for a single application to be parsed. Defaults to 30.
+            parser_fast (bool, optional): stop reading an application as soon as all fields have been found. Defaults to True.
+            parser_raw_text (bool, optional): use cheap text extraction without layout analysis. Defaults to False.
+            parser_cache_size (int, optional): number of parsed applications cached in memory. Defaults to 256.
+            parser_cache_dir (str, optional): directory for cached applications on disk. Disabled if None. Defaults to None.
+            parser_cache_ttl (float, optional): seconds a parsed application is kept in the cache, in memory and on disk. Defaults to 86400.
+            session_timeout (float, optional): seconds after which an application without new messages is abandoned. Defaults to 1800.
+            session_store (str, optional): where unfinished applications are kept: "memory", "sqlite" or "mysql". Defaults to "memory".
+            session_path (str, optional): file of the SQLite session store. Defaults to "sessions.db".
+            session_batch_size (int, optional): number of changed sessions that triggers a write to the session store. Defaults to 64.
+            session_flush_interval (float, optional): maximum number of seconds before a changed session is written. Defaults to 0.5.
+            db_pool_min_size (int, optional): number of database connections opened up front. Defaults to 1.
+            db_pool_size (int, optional): maximum number of open database connections. Defaults to 8.
+            db_pool_timeout (float, optional): seconds to wait for a free database connection. Defaults to 10.
+            db_pre_ping (bool, optional): check that a database connection is alive before using it. Defaults to True.
+            db_batch_size (int, optional): maximum number of finished applications saved in one batch. Defaults to 100.
+            db_flush_interval (float, optional): maximum number of seconds a finished application waits for its batch. Defaults to 0.5.
+            db_max_queue (int, optional): maximum number of finished applications waiting to be saved. Defaults to 10000.
+            db_journal (str, optional): file that keeps finished applications until they are saved. Disabled if None. Defaults to None.
+            db_user_cache_size (int, optional): number of saved applications cached by user id. Defaults to 1024.
+            db_user_cache_ttl (float, optional): seconds a cached application may be served before it's read again. Defaults to 60.
+            prediction_cache_size (int, optional): number of cached outputs of each ML model. Defaults to 4096.
         """
 
         self.norm = normalization
 
+        # Parse applications outside of the event loop. Resubmitted applications are served from the cache
+        self.parse_pool = ParsePool(int(parser_workers), int(parser_queue), float(parser_timeout), parser_fast, parser_raw_text,
+            ParseCache(int(parser_cache_size), parser_cache_dir, float(parser_cache_ttl)))
+
         super().__init__(command_prefix = "/", intents = discord.Intents.all())
 
+        self._set_db(hostname, username, password, db_pool_min_size, db_pool_size, db_pool_timeout, db_pre_ping, db_user_cache_size,
+            db_user_cache_ttl) # Establish database connections
+        self.db.start_writer(int(db_batch_size), float(db_flush_interval), int(db_max_queue), db_journal) # Finished applications are saved in batches
+        self.async_db = AsyncLoanDatabase(self.db) # Queries made from coroutines run in database threads
+
+        # One session per applicant in a channel. Session changes are written in batches off the event loop
+        self.session_store = WriteBehindSessionStore(self._create_session_store(session_store, session_path), int(session_batch_size),
+            float(session_flush_interval))
+        self.sessions = SessionManager(float(session_timeout), store = self.session_store)
 
         self.setup() # Notify when ready
+        self.init_dispatcher() # Route messages to sessions
         self.add_commands() # Define commands
-        self.__set_db(hostname, username, password) # Establish database connection
+
+        self.models = ModelRegistry.shared()
+        self.models.load() # Load all ML models once. Every prediction shares them
+        LoanPredictor.configure_cache(int(prediction_cache_size)) # Applicants with identical features share model outputs
         
     
     def setup(self) -> None:
@@ -48,13 +105,49 @@ class LoanBot(commands.Bot):
         async def on_ready() -> None:
             print("Bot is now online")
 
-    def _set_db(self, hostname, username, password) -> None:
+    async def close(self) -> None:
+        """Stop the bot and its worker processes
+        """
+
+        self.parse_pool.shutdown()
+        self.session_store.close() # Write sessions that are still buffered
+        self.async_db.close()
+        self.db.close() # Saves applications that are still buffered
+
+        await super().close()
+
+    def _set_db(self, hostname, username, password, pool_min_size = 1, pool_size = 8, pool_timeout = 10, pre_ping = True, user_cache_size = 1024,
+                user_cache_ttl = 60) -> None:
 
         self.db_username = username
         self.db_hostname = hostname
         self.db_password = password
 
-        self.db = LoanDatabase(self.db_username, self.db_hostname, self.db_password)
+        self.db = LoanDatabase(self.db_username, self.db_hostname, self.db_password, int(pool_min_size), int(pool_size), float(pool_timeout), pre_ping,
+            int(user_cache_size), float(user_cache_ttl))
+
+    def _create_session_store(self, kind: str, path: str) -> SessionStore:
+        """Create a storage for unfinished applications
+
+        Args:
+            kind (str): "memory", "sqlite" or "mysql"
+            path (str): file of the SQLite store
+
+        Raises:
+            ValueError: if the kind of store is unknown
+
+        Returns:
+            SessionStore: session store
+        """
+
+        if kind == "memory":
+            return MemorySessionStore()
+        elif kind == "sqlite":
+            return SQLiteSessionStore(path)
+        elif kind == "mysql":
+            return MySQLSessionStore(self.db)
+
+        raise ValueError(f"Unknown session store: {kind}. Expected memory, sqlite or mysql")
 
     @staticmethod
     def is_name(name: str) -> bool:
@@ -66,7 +159,7 @@ class LoanBot(commands.Bot):
         Returns:
             bool: true if this is a name of an individual, false otherwise
         """
-        return re.match(r"^[\-'a-zA-Z ]+$", name) is not None
+        return len(name) <= LoanDatabase.max_text_length and re.match(r"^[\-'a-zA-Z ]+$", name) is not None
 
     async def get_stage_zero(self, message: discord.Message, usr: LoanUser) -> None:
         """Interaction for the stage zero. Get name and id of the user.
@@ -84,10 +177,10 @@ class LoanBot(commands.Bot):
             if gave_name != None:
                 usr.name = message.content
             else:
-                usr.name = message.author.display_name
+                usr.name = message.author.display_name[:LoanDatabase.max_text_length]
 
             usr.user_id = message.author.id
-            usr.push_to_df(["name", "id"], [usr.name, usr.user_id]) # Push new data to df
+            usr.push_to_df(["name", "id"], [usr.name, usr.user_id]) # Push new data to the user record
 
             await message.channel.send(f"Perfect, {usr.name}! I'll create an account for you right away!\nAll done!\nNow, what loan amount are you planning to receive?")
 
@@ -102,15 +195,16 @@ class LoanBot(commands.Bot):
             message (discord.Message): message received from the user
             usr (LoanUser): current user object
         """
-        if message.content.isnumeric():  # Check if user gave a number. Loan amount must be numeric
+        # Check if user gave a number. Loan amount must be a whole number the loan table can hold
+        if message.content.isdecimal() and message.content.isascii() and 0 < int(message.content) <= LoanBot.max_loan_amount:
 
-                usr.push_to_df(["loan_amount"], [int(message.content)])  # Push this amount to the dataframe 
+                usr.push_to_df(["loan_amount"], [int(message.content)])  # Push this amount to the user record 
                 await message.channel.send(f"Wonderful!! We will be looking for a ${message.content} loan\nPlease, fill out the attached document and send it back to me as a .pdf file")
                 await message.channel.send(file = discord.File("LoanApplicationExample.docx"))
 
                 usr.update_stage() # proceed to next stage
         else:
-            await message.channel.send("Sorry, I don't think this is a valid amount. Please make sure that you enter a valid number without '$'")
+            await message.channel.send(f"Sorry, I don't think this is a valid amount. Please make sure that you enter a valid number without '$' up to {LoanBot.max_loan_amount}")
 
     def _get_info_message(self, usr_data: dict) -> str:
         """Generates a string equivalent of a dictionary with user data in it
@@ -139,42 +233,52 @@ class LoanBot(commands.Bot):
             usr (LoanUser): current user object
         """
 
-        if len(message.attachments) != 1 or not (file_name := message.attachments[0].filename).endswith(".pdf"):
+        if len(message.attachments) != 1 or not message.attachments[0].filename.endswith(".pdf"):
             return
 
-        file_path = "apps/" + file_name
+        attachment = message.attachments[0]
         try: 
-            await message.attachments[0].save(file_path)
+            document = await attachment.read() # Parsed straight from memory, nothing is written to disk
             
-            parser = LoanApplicationParser(file_path)
-            usr_data = parser.parse()
+            usr_data = await self.parse_pool.parse(document) # Parsed in a worker process, other users are served meanwhile
         except ValueError:
             await message.channel.send("Sorry, I couldn't parse some fields of your application. Please make sure to follow guidelines and resubmit your application")
+            return
+        except (ParserBusyError, asyncio.TimeoutError):
+            await message.channel.send("Sorry, we are processing too many applications right now. Please try resubmit your application in a few minutes")
+            return
         except discord.HTTPException:
             try:
-                os.remove(file_path)
                 await message.channel.send("Sorry, an error occured. Please try resubmit you application")
-                await message.attachments[0].save(file_path)
+                document = await attachment.read()
                 
-                parser = LoanApplicationParser(file_path)
-                usr_data = parser.parse()
-            except ValueError:
+                usr_data = await self.parse_pool.parse(document)
+            except (ValueError, ParserBusyError, asyncio.TimeoutError, discord.HTTPException):
                 await message.channel.send("Sorry, I couldn't parse some fields of your application. Please make sure to follow guidelines and resubmit your application")
+                return
+
+        # Unreadable documents and documents that crashed a parser worker give no answers
+        if not usr_data:
+            await message.channel.send("Sorry, I couldn't parse some fields of your application. Please make sure to follow guidelines and resubmit your application")
+            return
+
+        # Every answer must fit its column of the loan table, otherwise the application could never be saved
+        if any(len(str(value)) > LoanDatabase.max_text_length for value in usr_data.values()):
+            await message.channel.send(f"Sorry, some answers of your application are longer than {LoanDatabase.max_text_length} characters. Please shorten them and resubmit your application")
+            return
 
-        usr_info = self.__get_info_message(usr_data)
+        usr_info = self._get_info_message(usr_data)
 
         await message.channel.send(f"Splendid! Here is what I managed to learn from your application:\n\nName: {usr.name}\n{usr_info}\n\n\n Now, please provide us with your age")
-        os.remove(file_path)
 
-        usr.push_to_df(list(usr_data.keys()), list(usr_data.values())) # Update dataframe with new infromation
-        print(usr.user_data)
+        usr.push_to_df(list(usr_data.keys()), list(usr_data.values())) # Update user record with new infromation
         usr.update_stage()
 
     async def get_stage_three(self, message: discord.Message, usr: LoanUser) -> None:
 
-        if message.content.isnumeric() and 0 < int(message.content) < 130:  # Check if user gave a right number. 
+        if message.content.isdecimal() and message.content.isascii() and 0 < int(message.content) < 130:  # Check if user gave a right number. 
 
-                usr.push_to_df(["age"], [int(message.content)])  # Push this amount to the dataframe 
+                usr.push_to_df(["age"], [int(message.content)])  # Push this amount to the user record 
                 await message.channel.send("Got it! Now, give me a moment while I calculate your results...")
 
                 predictor = LoanPredictor(usr)
@@ -182,11 +286,13 @@ class LoanBot(commands.Bot):
                 interest_rate = predictor._get_interest_rate(weight_normalization = self.norm)
 
                 await message.channel.send(f"Your expected interest is: {interest_rate}")
-                usr.push_to_df(["interest_rate"], [interest_rate]) # Push calculated interest rate to user dataframe
+                usr.push_to_df(["interest_rate"], [interest_rate]) # Push calculated interest rate to user record
 
-                usr.dump_data_to_sql(self.db)
+                usr.update_stage() # proceed to next stage. Done first, so messages sent while saving don't repeat this stage
 
-                usr.update_stage() # proceed to next stage
+                # Saved in a database thread, other users are served meanwhile
+                if not await self.async_db.upsert_user(usr):
+                    await message.channel.send("Sorry, I couldn't save your application right now. Please try again in a few minutes with /apply")
         else:
             await message.channel.send("Sorry, I don't think this is a valid age. Try again")
 
@@ -198,7 +304,7 @@ class LoanBot(commands.Bot):
             message (Message): message that has been received from the user
             usr (LoanUser): Current user object
         See:
-            init_user()
+            init_dispatcher()
         """
 
         stage = usr.stage
@@ -216,20 +322,26 @@ class LoanBot(commands.Bot):
             raise ValueError(f"Incorrect Stage Has Been Passed: Stage: {stage}")
 
               
-    def init_user(self, usr: LoanUser) -> None:
-        """A wrapper function for respond_to_user(). Listens for messages and ignores those messages that were sent by the bot itself. 
-
-        Args:
-            usr (LoanUser): Empty user object
-        See:
-            apply()
+    def init_dispatcher(self) -> None:
+        """Listens for messages and routes each of them to the session of its author in this channel. Ignores messages sent by the bot itself,
+        commands and messages of users without an active application. See respond_to_user()
         """
         @self.listen()
         async def on_message(message: discord.Message):
-            if message.author == self.user:
+            self.sessions.evict_idle() # Drop abandoned applications. Cheap unless a sweep is due
+
+            if message.author == self.user or message.content.startswith(self.command_prefix):
                 return
-            else:
-                await self.respond_to_user(message, usr)
+
+            key = SessionManager.key(message.channel.id, message.author.id)
+
+            if (usr := self.sessions.get(key)) is None:
+                return
+
+            await self.respond_to_user(message, usr)
+
+            if usr.stage >= LoanBot.completed_stage: # Application is finished
+                self.sessions.close(key)
 
     def add_commands(self) -> None:
         """Define all "/" commands for this bot
@@ -246,7 +358,51 @@ class LoanBot(commands.Bot):
             user = LoanUser() # Create empty user object 
 
             await ctx.channel.send(f"Hello, thank you for choosing our services. Before we proceed, may I confrim that your full name is {ctx.author.display_name}?") # Welcome message
-            self.init_user(user) # Gather user data
+            self.sessions.open(SessionManager.key(ctx.channel.id, ctx.author.id), user) # Gather user data. Replaces any unfinished application
+
+        @self.command(name = "reload_models")
+        @commands.is_owner()
+        async def reload_models(ctx: discord.ext.commands.Context) -> None:
+            """/reload_models command. Hot-reloads ML models if their files have changed on disk. Only available to the owner of the bot
+
+            Args:
+                ctx (Context): context at which command has been called
+            """
+
+            # Unpickling models takes a while, the event loop keeps serving the gateway meanwhile
+            if await asyncio.get_running_loop().run_in_executor(None, self.models.reload):
+                LoanPredictor.clear_cache() # Outputs of old models can't be served anymore
+                await ctx.channel.send(f"Models have been reloaded. Current version: {self.models.version}")
+            else:
+                await ctx.channel.send("Models are up to date")
+
+        @self.command(name = "parse_stats")
+        @commands.is_owner()
+        async def parse_stats(ctx: discord.ext.commands.Context) -> None:
+            """/parse_stats command. Shows how many applications were served from the parse cache. Only available to the owner of the bot
+
+            Args:
+                ctx (Context): context at which command has been called
+            """
+
+            stats = self.parse_pool.cache.stats()
+
+            await ctx.channel.send(f"Parse cache: {stats['memory_hits']} memory hits, {stats['disk_hits']} disk hits, {stats['misses']} misses "
+                f"({stats['hit_rate']:.1%} hit rate), {stats['size']}/{stats['capacity']} applications in memory")
+
+        @self.command(name = "predict_stats")
+        @commands.is_owner()
+        async def predict_stats(ctx: discord.ext.commands.Context) -> None:
+            """/predict_stats command. Shows how many model outputs were served from prediction caches. Only available to the owner of the bot
+
+            Args:
+                ctx (Context): context at which command has been called
+            """
+
+            lines = [f"{model.capitalize()} cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate), "
+                f"{stats['size']}/{stats['capacity']} outputs" for model, stats in LoanPredictor.cache_stats().items()]
+
+            await ctx.channel.send("\n".join(lines))
 
 
     
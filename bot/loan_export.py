@@ -0,0 +1,200 @@
+import csv
+import datetime
+from typing import TYPE_CHECKING, Iterator, List, Optional
+from bot.loan_database import LoanDatabase
+
+if TYPE_CHECKING: # pyarrow is optional and imported where Parquet is written
+    import pyarrow
+
+
+class LoanExporter(object):
+    """Streams the loan table to a CSV or Parquet file. Rows are read with an unbuffered cursor, so the server sends them as they are
+    fetched, and written chunk by chunk. Memory use depends on the chunk size only, not on the size of the table
+    """
+
+    columns: list = list(LoanDatabase.table_columns) + ["created_at"]
+    formats: tuple = ("csv", "parquet")
+
+    def __init__(self, db: LoanDatabase, chunk_size: int = 10000) -> None:
+        """Construct an exporter
+
+        Args:
+            db (LoanDatabase): Database object connected MySQL Server
+            chunk_size (int, optional): number of rows fetched and written at once. Defaults to 10000.
+        """
+
+        self.db = db
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def _query(since: datetime.date = None, until: datetime.date = None, grades: List[str] = None) -> tuple:
+        """Build the export query
+
+        Args:
+            since (datetime.date, optional): first day of applications to export. Defaults to None.
+            until (datetime.date, optional): day after the last day of applications to export. Defaults to None.
+            grades (List[str], optional): loan grades to export. All grades if None. Defaults to None.
+
+        Returns:
+            tuple: query with %s placeholders and its parameters
+        """
+
+        conditions, params = [], []
+
+        if since is not None:
+            conditions.append("created_at >= %s")
+            params.append(since)
+        if until is not None:
+            conditions.append("created_at < %s")
+            params.append(until)
+        if grades:
+            conditions.append(f"loan_grade IN ({', '.join(['%s'] * len(grades))})")
+            params.extend(grades)
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        return f"SELECT {', '.join(LoanExporter.columns)} FROM {LoanDatabase.table_name}{where}", tuple(params)
+
+    def chunks(self, since: datetime.date = None, until: datetime.date = None, grades: List[str] = None) -> Iterator[list]:
+        """Read matching rows of the loan table in chunks. Holds one pooled connection until all rows have been read
+
+        Args:
+            since (datetime.date, optional): first day of applications to export. Defaults to None.
+            until (datetime.date, optional): day after the last day of applications to export. Defaults to None.
+            grades (List[str], optional): loan grades to export. All grades if None. Defaults to None.
+
+        Yields:
+            list: up to chunk_size rows in column order
+        """
+
+        query, params = LoanExporter._query(since, until, grades)
+        connection = self.db.pool.acquire()
+
+        try:
+            cursor = connection.cursor(buffered = False) # Rows stay on the socket until they are fetched
+            cursor.execute(query, params)
+
+            while rows := cursor.fetchmany(self.chunk_size):
+                yield rows
+
+            cursor.close()
+        except BaseException:
+            self.db.pool.discard(connection) # May still have unread rows, it can't be reused
+            raise
+
+        self.db.pool.release(connection)
+
+    def to_csv(self, path: str, since: datetime.date = None, until: datetime.date = None, grades: List[str] = None) -> int:
+        """Export matching rows to a CSV file with a header
+
+        Args:
+            path (str): path to the CSV file
+            since (datetime.date, optional): first day of applications to export. Defaults to None.
+            until (datetime.date, optional): day after the last day of applications to export. Defaults to None.
+            grades (List[str], optional): loan grades to export. All grades if None. Defaults to None.
+
+        Returns:
+            int: number of exported rows
+        """
+
+        exported = 0
+
+        with open(path, "w", newline = "", encoding = "utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(LoanExporter.columns)
+
+            for rows in self.chunks(since, until, grades):
+                writer.writerows(rows)
+                exported += len(rows)
+
+        return exported
+
+    @staticmethod
+    def _arrow_schema() -> "pyarrow.Schema":
+        """Parquet schema of the export, derived from column types of the loan table. Fixed up front, so chunks with only NULLs
+        in some column still match it
+
+        Returns:
+            pyarrow.Schema: schema of exported columns
+        """
+
+        import pyarrow as pa
+
+        integer_types = {"TINYINT": (pa.int8(), pa.uint8()), "SMALLINT": (pa.int16(), pa.uint16()), "INT": (pa.int32(), pa.uint32()),
+            "BIGINT": (pa.int64(), pa.uint64())}
+
+        fields = []
+
+        for name, definition in LoanDatabase.table_columns.items():
+            sql_type, *modifiers = definition.split()
+
+            if sql_type in integer_types:
+                signed, unsigned = integer_types[sql_type]
+                fields.append(pa.field(name, unsigned if "UNSIGNED" in modifiers else signed))
+            else:
+                fields.append(pa.field(name, pa.string()))
+
+        fields.append(pa.field("created_at", pa.timestamp("s")))
+
+        return pa.schema(fields)
+
+    def to_parquet(self, path: str, since: datetime.date = None, until: datetime.date = None, grades: List[str] = None) -> int:
+        """Export matching rows to a Parquet file. Every chunk becomes a row group. Requires pyarrow
+
+        Args:
+            path (str): path to the Parquet file
+            since (datetime.date, optional): first day of applications to export. Defaults to None.
+            until (datetime.date, optional): day after the last day of applications to export. Defaults to None.
+            grades (List[str], optional): loan grades to export. All grades if None. Defaults to None.
+
+        Raises:
+            ImportError: if pyarrow isn't installed
+
+        Returns:
+            int: number of exported rows
+        """
+
+        # pyarrow is only needed for Parquet exports
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet export requires pyarrow. Install it with: pip install pyarrow")
+
+        schema = LoanExporter._arrow_schema()
+        exported = 0
+
+        with pq.ParquetWriter(path, schema) as writer:
+            for rows in self.chunks(since, until, grades):
+                columns = list(zip(*rows))
+                writer.write_table(pa.Table.from_arrays([pa.array(values, type = field.type) for values, field in zip(columns, schema)], schema = schema))
+                exported += len(rows)
+
+        return exported
+
+    def export(self, path: str, file_format: Optional[str] = None, since: datetime.date = None, until: datetime.date = None,
+               grades: List[str] = None) -> int:
+        """Export matching rows of the loan table
+
+        Args:
+            path (str): path to the output file
+            file_format (Optional[str], optional): "csv" or "parquet". Taken from the file extension if None. Defaults to None.
+            since (datetime.date, optional): first day of applications to export. Defaults to None.
+            until (datetime.date, optional): day after the last day of applications to export. Defaults to None.
+            grades (List[str], optional): loan grades to export. All grades if None. Defaults to None.
+
+        Raises:
+            ValueError: if the format is unknown
+
+        Returns:
+            int: number of exported rows
+        """
+
+        file_format = file_format or path.rsplit(".", 1)[-1].lower()
+
+        if file_format == "csv":
+            return self.to_csv(path, since, until, grades)
+        elif file_format == "parquet":
+            return self.to_parquet(path, since, until, grades)
+
+        raise ValueError(f"Unknown export format: {file_format}. Expected one of {', '.join(LoanExporter.formats)}")
@@ -1,55 +1,51 @@
 import numpy as np
 import pandas as pd
-import pickle
 import os
 from scipy import stats
 from bot.loan_user import LoanUser 
-from typing import Union, Tuple
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.linear_model import LogisticRegression
-from sklearn.preprocessing import LabelEncoder, StandardScaler, OrdinalEncoder
-from sklearn.decomposition import PCA
+from bot.model_registry import ModelRegistry, ModelBundle
+from bot.lru_cache import LRUCache
+from typing import Callable, Hashable, Iterable, List, Union, Tuple
 
 class LoanPredictor(object):
     """Predicts loan interest rate
     """
 
-    # Default names for ML models
-    salary_model_filename: str = os.path.join('models', "salary_model.sav")
-    risk_model_filename: str = os.path.join('models', "risk_model.sav")
+    # Features of the salary prediction model (in the order used for training)
+    salary_columns: list = ["age", "workclass", "education", "marrital_status", "occupation", "race", "sex", "hours_per_week", "native_country"]
+    salary_categorical_columns: list = ["workclass", "education", "occupation", "race", "sex", "native_country"]
 
-    # Encoders
-    risk_encoder: str = os.path.join('encoders', "risk_encoder.npy")
-    risk_pca_mean: str = os.path.join('encoders', "risk_pca_mean.sav")
-    salary_encoder: str = os.path.join('encoders', "salary_encoder.npy")
+    # Features of the risk prediction model (in the order used for training)
+    risk_columns: list = ["age", "income", "person_home_ownership", "employed", "loan_grade", "loan_amount", "cb_person_default_on_file"]
+    risk_categorical_columns: list = ["income", "person_home_ownership", "employed", "loan_grade", "cb_person_default_on_file"]
 
+    average_default_probability: float = 0.2181 # Average probability of default in the risk dataset
 
-    def __init__(self, usr: LoanUser) -> None:
+    # Model outputs shared by all predictions. Keys include the serial number of the model bundle, so outputs of replaced models or models
+    # of another registry are never served. See .configure_cache()
+    salary_cache: LRUCache = LRUCache(capacity = 4096)
+    risk_cache: LRUCache = LRUCache(capacity = 4096)
+    cache_rows: int = 100 # Bigger batches bypass the caches. Building a key for every row costs more than the few hits they get
+
+
+    def __init__(self, usr: LoanUser, registry: ModelRegistry = None) -> None:
         """Default constructor for the predictor
 
         Args:
             usr (LoanUser): current user
+            registry (ModelRegistry, optional): registry that holds loaded ML models. Defaults to the process-wide registry.
         """
         
         self.usr = usr
 
+        # Models are taken once so that a hot-reload in the middle of a prediction doesn't mix two model versions
+        self.models = (registry or ModelRegistry.shared()).get()
+
         # Final Results for both ML models
         self.predicted_salary = None
         self.chance_of_default = None
 
-        self.__clean_data()
-
-    def _load_model(self, file_name: str) -> object:
-        """Loads ML model from a file
-
-        Args:
-            file_name (str): name of the file
-
-        Returns:
-            object: any object that has been saved in a given file. For this particular project, this method used to load categories_ and mean_ object for ML models  
-        """
-
-        return pickle.load(open(file_name, "rb"))
+        self._clean_data()
 
 
     def _separate_data(self) -> Tuple[pd.DataFrame, None]:
@@ -59,7 +55,7 @@ class LoanPredictor(object):
         """
 
         try:
-            salary_data = ((self.usr).user_data)[["age", "workclass", "education", "marrital_status", "occupation", "race", "sex", "hours_per_week", "native_country"]]
+            salary_data = self.usr.record.to_frame(LoanPredictor.salary_columns)
         except:
             return None
         
@@ -70,46 +66,175 @@ class LoanPredictor(object):
         """Preprocessing. Change native country to binary classification (developed, developing)
         """
 
-        hdi_path = os.path.join('data', "HDI.csv")
-
-        developed_countries: list = pd.read_csv(hdi_path)
-        developed_countries = developed_countries[developed_countries["hdi2019"] >= 0.8] # Drop developing countries
-        developed_countries = (developed_countries["country"]).tolist() # Get a list of only developed countries
-
-        if self.usr.user_data.loc[0, "native_country"] in developed_countries:
-            self.usr.user_data.loc[0, "native_country"] = "developed"
-        else:
-            self.usr.user_data.loc[0, "native_country"] = "developing"
+        self.usr.record.native_country = self.models.country_index.classify(self.usr.record.native_country)
 
     def _clean_data(self) -> None:
         """Wrapper method. Perfoms all nessesary data cleaning operations 
         """
 
-        self.__change_country_to_binary()
+        self._change_country_to_binary()
 
-        self.salary_data = self.__separate_data()
+        self.salary_data = self._separate_data()
 
-    def _predict_salary(self) -> None:
-        """Predicts whether user salary is above $50K a year and pushes results to dataframe
+    @classmethod
+    def configure_cache(cls, capacity: int) -> None:
+        """Replace prediction caches with empty caches of a given size
+
+        Args:
+            capacity (int): maximum number of cached outputs of each model. Caching is disabled if 0
         """
 
-        loaded_model = self.__load_model(self.salary_model_filename)
-        
+        cls.salary_cache = LRUCache(capacity = capacity)
+        cls.risk_cache = LRUCache(capacity = capacity)
 
-        encoder = OrdinalEncoder()
-        encoder.categories_ = np.load(self.salary_encoder, allow_pickle = True)
+    @classmethod
+    def clear_cache(cls) -> None:
+        """Drop all cached model outputs. Hit and miss counts are kept
+        """
 
-        # Encode 
-        self.salary_data[["workclass", "education", "occupation", "race", "sex", "native_country"]] = encoder.transform(self.salary_data[["workclass", "education", "occupation", "race", "sex", "native_country"]])
-        
-        # Predict
-        predicted_income = loaded_model.predict(self.salary_data)
+        cls.salary_cache.clear()
+        cls.risk_cache.clear()
+
+    @classmethod
+    def cache_stats(cls) -> dict:
+        """Usage statistics of prediction caches. See LRUCache.stats()
+
+        Returns:
+            dict: statistics of the "salary" and "risk" caches
+        """
+
+        return {"salary": cls.salary_cache.stats(), "risk": cls.risk_cache.stats()}
+
+    @staticmethod
+    def _cached(cache: LRUCache, serial: int, n_rows: int, keys: Iterable[Hashable], predict: Callable[[np.ndarray], np.ndarray]) -> np.ndarray:
+        """Look up model outputs in a cache and predict only the missing ones. Identical rows are predicted once.
+        Every row is predicted directly if caching is disabled or the batch has more than cache_rows rows
+
+        Args:
+            cache (LRUCache): cache of model outputs
+            serial (int): serial number of the model bundle that makes predictions. See ModelBundle
+            n_rows (int): number of rows
+            keys (Iterable[Hashable]): feature values of each row. Only consumed if the cache is used
+            predict (Callable[[np.ndarray], np.ndarray]): predicts outputs for rows at given positions
+
+        Returns:
+            np.ndarray: output for each row
+        """
+
+        if cache.capacity <= 0 or n_rows > LoanPredictor.cache_rows:
+            return np.asarray(predict(np.arange(n_rows)))
+
+        unique: dict = {} # Key -> position among unique keys, in order of first occurrence
+        inverse = np.fromiter((unique.setdefault(key, len(unique)) for key in keys), dtype = np.intp)
+        first_rows = np.unique(inverse, return_index = True)[1]
+
+        missing = object()
+        outputs = [cache.get((serial, key), missing) for key in unique]
+        misses = [position for position, output in enumerate(outputs) if output is missing]
+
+        if misses:
+            keys = list(unique)
+
+            for position, output in zip(misses, predict(first_rows[misses])):
+                outputs[position] = output
+                cache.put((serial, keys[position]), output)
+
+        return np.asarray(outputs)[inverse]
+
+    @staticmethod
+    def _encode_salary(models: ModelBundle, salary_data: pd.DataFrame) -> np.ndarray:
+        """Encode salary model features for any number of applicants
+
+        Args:
+            models (ModelBundle): loaded ML models
+            salary_data (pd.DataFrame): salary model features. Native country must already be changed to binary classification
+
+        Returns:
+            np.ndarray: (n_applicants, n_features) matrix ready for the salary model
+        """
+
+        salary_data = salary_data[LoanPredictor.salary_columns].copy()
+        salary_data[LoanPredictor.salary_categorical_columns] = models.salary_encoder.transform(salary_data[LoanPredictor.salary_categorical_columns])
+
+        return salary_data.to_numpy(dtype = np.float64)
+
+    @staticmethod
+    def _predict_income(models: ModelBundle, salary_features: np.ndarray) -> np.ndarray:
+        """Predict whether salary is above $50K a year for any number of applicants
+
+        Args:
+            models (ModelBundle): loaded ML models
+            salary_features (np.ndarray): encoded salary model features. See ._encode_salary()
+
+        Returns:
+            np.ndarray: "<=50K" or ">50K" for each applicant
+        """
+
+        predicted_income = LoanPredictor._cached(LoanPredictor.salary_cache, models.serial, len(salary_features), map(tuple, salary_features.tolist()),
+            lambda rows: models.salary_model.predict(salary_features[rows]))
+
+        return np.where(predicted_income == 0, "<=50K", ">50K")
+
+    @staticmethod
+    def _encode_risk(models: ModelBundle, risk_data: pd.DataFrame) -> np.ndarray:
+        """Encode risk model features and rotate them with the PCA for any number of applicants
 
+        Args:
+            models (ModelBundle): loaded ML models
+            risk_data (pd.DataFrame): risk model features, including predicted income
+
+        Returns:
+            np.ndarray: (n_applicants, n_components) matrix ready for the risk model
+        """
+
+        risk_data = risk_data[LoanPredictor.risk_columns].copy()
+        risk_data[LoanPredictor.risk_categorical_columns] = models.risk_encoder.transform((risk_data[LoanPredictor.risk_categorical_columns]).to_numpy())
+
+        return models.risk_pca.transform(risk_data.to_numpy(dtype = np.float64))
+
+    @staticmethod
+    def _predict_default(models: ModelBundle, risk_features: np.ndarray) -> np.ndarray:
+        """Predict the likelyhood of defaulting on a loan for any number of applicants
+
+        Args:
+            models (ModelBundle): loaded ML models
+            risk_features (np.ndarray): encoded risk model features. See ._encode_risk()
+
+        Returns:
+            np.ndarray: likelyhood of defaulting on a loan for each applicant [0, 1]
+        """
+
+        return models.risk_model.predict_proba(risk_features)[:, 1]
+
+    @staticmethod
+    def _default_probability(models: ModelBundle, risk_data: pd.DataFrame) -> np.ndarray:
+        """Predict the likelyhood of defaulting on a loan from raw risk model features. Uses the compiled risk model if it has been loaded.
+        Outputs are cached by raw feature values. Ordinal encoding is one-to-one, so they identify encoded features of either model and hits skip encoding too
+
+        Args:
+            models (ModelBundle): loaded ML models
+            risk_data (pd.DataFrame): risk model features, including predicted income
+
+        Returns:
+            np.ndarray: likelyhood of defaulting on a loan for each applicant [0, 1]
+        """
+
+        def predict(rows: np.ndarray) -> np.ndarray:
+            if models.compiled_risk is not None:
+                return models.compiled_risk.predict_default(risk_data.iloc[rows])
+
+            return LoanPredictor._predict_default(models, LoanPredictor._encode_risk(models, risk_data.iloc[rows]))
+
+        return LoanPredictor._cached(LoanPredictor.risk_cache, models.serial, len(risk_data),
+            risk_data[LoanPredictor.risk_columns].itertuples(index = False, name = None), predict)
+
+    def _predict_salary(self) -> None:
+        """Predicts whether user salary is above $50K a year and pushes results to dataframe
+        """
+
+        predicted_income = LoanPredictor._predict_income(self.models, LoanPredictor._encode_salary(self.models, self.salary_data))
 
-        if predicted_income == 0:
-            self.usr.push_to_df(["income"], ["<=50K"])
-        else:
-            self.usr.push_to_df(["income"], [">50K"])
+        self.usr.push_to_df(["income"], [predicted_income[0]])
 
     def _predict_risk(self) -> float:
         """Predicts the likelyhood of defaulting on a loan
@@ -118,49 +243,75 @@ class LoanPredictor(object):
             float: likelyhood of defaulting on a loan for a given user [0, 1]
         """
 
-        predicted_risk = None
         # Predict salary
 
-        self.__predict_salary()
+        self._predict_salary()
 
-        # Extract risk model columns
-        risk_data = ((self.usr).user_data)[["age", "income", "person_home_ownership", "employed", "loan_grade", "loan_amount", "cb_person_default_on_file"]]
-        categorical_cols = ["income", "person_home_ownership", "employed", "loan_grade", "cb_person_default_on_file"]
-        
-        # PCA 
+        # Predict 
+        return LoanPredictor._default_probability(self.models, self.usr.record.to_frame(LoanPredictor.risk_columns))[0]
 
-        # Load encoder 
-        encoder = OrdinalEncoder()
-        encoder.categories_ = np.load(self.risk_encoder, allow_pickle = True)
+    @staticmethod
+    def _to_percent(interest: Union[float, np.ndarray], loan_amount: Union[float, np.ndarray]) -> Union[int, np.ndarray]:
+        """Transform interest amount to percentage of original loan amount
 
-        risk_data[categorical_cols] = encoder.transform((risk_data[categorical_cols]).to_numpy().reshape(1, -1))
+        Args:
+            interest (Union[float, np.ndarray]): calculated interest amount
+            loan_amount (Union[float, np.ndarray]): original loan amount 
 
-        pca = PCA()
-        pca.components_ = self.__load_model(self.risk_model_filename)
-        pca.mean_ = self.__load_model(self.risk_pca_mean)
-        pca_data = pca.transform(risk_data)
+        Returns:
+            Union[int, np.ndarray]: interest rate (rounded down) 
+        """
+        return np.trunc((interest / loan_amount) * 100).astype(int)
 
-        # Load Model
-        loaded_model = self.__load_model(self.risk_model_filename)
+    @staticmethod
+    def interest_rates(probabilities: Union[float, np.ndarray], loan_amounts: Union[float, np.ndarray], theta_rates: Union[float, np.ndarray] = 0,
+                       weight_normalizations: Union[float, np.ndarray] = 0) -> np.ndarray:
+        """Calculates interest rates from loan amounts and risks of default for any number of applicants. See ._get_interest_rate().
+        All arguments are broadcast against each other with NumPy rules, so any of them may be a scalar or an array
 
-        # Predict 
-        predicted_risk = loaded_model.predict_proba(pca_data)
+        Args:
+            probabilities (Union[float, np.ndarray]): individual probabilities of default
+            loan_amounts (Union[float, np.ndarray]): original loan amounts
+            theta_rates (Union[float, np.ndarray], optional): Percentage of original loan amount that is expected to be the minimul profit amount for the loan issuer.
+                Values outside of [0, 1] are replaced with 0. Defaults to 0.
+            weight_normalizations (Union[float, np.ndarray], optional): Normalization value that decreases or increases the average default probability. Defaults to 0.
+
+        Returns:
+            np.ndarray: final interest rates in the broadcast shape of the arguments
+        """
 
-        return predicted_risk[0, 1]
+        theta_rates = np.asarray(theta_rates, dtype = np.float64)
+        theta_rates = np.where((theta_rates < 0) | (theta_rates > 1), 0, theta_rates)
 
-    def _to_percent(self, interest: float, loan_amount: float) -> int:
-        """Transform interest amount to percentage of original loan amount
+        average_probability = LoanPredictor.average_default_probability * (1 - np.asarray(weight_normalizations, dtype = np.float64))
+
+        weighted_probability = np.asarray(probabilities, dtype = np.float64) * average_probability
+        loan_amounts = np.asarray(loan_amounts, dtype = np.float64)
+
+        interest = ((theta_rates * loan_amounts) + loan_amounts * weighted_probability) / 1 - weighted_probability
+
+        return LoanPredictor._to_percent(interest, loan_amounts)
+
+    @staticmethod
+    def interest_rate_grid(probabilities: np.ndarray, loan_amounts: np.ndarray, theta_rates: np.ndarray, weight_normalization: float = 0) -> np.ndarray:
+        """Evaluates interest rates over every combination of probability, loan amount and theta rate. Used for what-if analysis of pricing
 
         Args:
-            interest (float): calculated interest amount
-            loan_amount (float): original loan amount 
+            probabilities (np.ndarray): probabilities of default along the first axis
+            loan_amounts (np.ndarray): loan amounts along the second axis
+            theta_rates (np.ndarray): theta rates along the third axis. See .interest_rates()
+            weight_normalization (float, optional): Normalization value that decreases or increases the average default probability. Defaults to 0.
 
         Returns:
-            int: interest rate (rounded down) 
+            np.ndarray: (n_probabilities, n_loan_amounts, n_theta_rates) interest rates
         """
-        return int((interest / loan_amount) * 100)
-
 
+        return LoanPredictor.interest_rates(
+            np.asarray(probabilities, dtype = np.float64)[:, np.newaxis, np.newaxis],
+            np.asarray(loan_amounts, dtype = np.float64)[np.newaxis, :, np.newaxis],
+            np.asarray(theta_rates, dtype = np.float64)[np.newaxis, np.newaxis, :],
+            weight_normalization
+        )
 
     def _get_interest_rate(self, theta_rate: float = 0, weight_normalization: float = 0) -> int:
         """Calculates interest rate from loan amount and risk of default. This function maximizes interest amount such that expected gain from loan is greater than some value theta. That is E[gain] > theta. 
@@ -172,26 +323,52 @@ class LoanPredictor(object):
         Returns:
             int: final interest rate
         """
-        if 0> theta_rate > 1:
-            theta_rate = 0
 
-        average_probability = 0.2181 * (1 - weight_normalization)
         individual_probability = self._predict_risk()
+        loan_amount = self.usr.record.loan_amount
 
-        weighted_probability = individual_probability * average_probability
-        loan_amount = self.usr.user_data["loan_amount"].iloc[0]
+        return int(LoanPredictor.interest_rates(individual_probability, loan_amount, theta_rate, weight_normalization))
 
-        interest = ((theta_rate * loan_amount) + loan_amount * weighted_probability) / 1 - weighted_probability
+    @staticmethod
+    def compile_models(registry: ModelRegistry = None) -> None:
+        """Compile sklearn models into NumPy-only models used by the registry in compiled mode. See ModelRegistry.compile_risk_model() and ModelRegistry.compile_salary_model()
 
-        return self.__to_percent(interest, loan_amount)
+        Args:
+            registry (ModelRegistry, optional): registry that holds paths to the models. Defaults to the process-wide registry.
+        """
 
+        registry = registry or ModelRegistry.shared()
 
+        registry.compile_risk_model(LoanPredictor.risk_columns, LoanPredictor.risk_categorical_columns)
+        registry.compile_salary_model()
 
+    @staticmethod
+    def predict_batch(applicants: Union[pd.DataFrame, List[dict]], theta_rate: float = 0, weight_normalization: float = 0, registry: ModelRegistry = None) -> pd.DataFrame:
+        """Predicts default probability and interest rate for many applicants at once. Every step of the pipeline runs as a single vectorized call
 
-        
+        Args:
+            applicants (Union[pd.DataFrame, List[dict]]): applicant data. Must include columns used by both ML models except "income", which is predicted
+            theta_rate (float, optional): Percentage of original loan amount that is expected to be the minimul profit amount for the loan issuer. Defaults to 0.
+            weight_normalization (float, optional): Normalization value that decreases or increases the average default probability. Defaults to 0.
+            registry (ModelRegistry, optional): registry that holds loaded ML models. Defaults to the process-wide registry.
+
+        Returns:
+            pd.DataFrame: "income", "chance_of_default" and "interest_rate" for each applicant. Index matches the index of given applicants
+        """
 
+        models = (registry or ModelRegistry.shared()).get()
 
+        applicants = pd.DataFrame(applicants) if not isinstance(applicants, pd.DataFrame) else applicants.copy()
 
-        
+        # Preprocessing
+        applicants["native_country"] = [models.country_index.classify(country) for country in applicants["native_country"]]
+
+        # Predict salary, then use it to predict the risk of default
+        applicants["income"] = LoanPredictor._predict_income(models, LoanPredictor._encode_salary(models, applicants))
+        chance_of_default = LoanPredictor._default_probability(models, applicants)
 
-    
+        return pd.DataFrame({
+            "income": applicants["income"],
+            "chance_of_default": chance_of_default,
+            "interest_rate": LoanPredictor.interest_rates(chance_of_default, applicants["loan_amount"].to_numpy(), theta_rate, weight_normalization)
+        }, index = applicants.index)
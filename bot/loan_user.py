@@ -1,5 +1,7 @@
 import pandas as pd
+from typing import Hashable, Union
 from bot.loan_database import *
+from bot.applicant_record import ApplicantRecord
 
 
 class LoanUser:
@@ -11,26 +13,19 @@ class LoanUser:
 
     """
 
-    __column_names: list = [
-            "id", "name", "age", "sex", "employed", "workclass", "education",
-            "marrital_status", "occupation", "race", "hours_per_week", "native_country",
-            "income", "person_home_ownership", "loan_grade", "loan_amount",
-            "cb_person_default_on_file", "loan_status", "interest_rate", "notes"
-            ]
 
-
-    def _init__(self, name: str = None, age: int = None) -> None:
+    def __init__(self, name: str = None, age: int = None) -> None:
         self.name = name
         self.age = age
+        self.user_id = None
 
-        # Create user dataframe
-        self.__generate_user_dataframe()
-        self.data = {}
-        
+        # Session store that keeps a copy of this user between restarts. See SessionManager
+        self.session_store = None
+        self.session_key: Hashable = None
 
-        # Assign name and age to dataframe
-        (self.user_data).loc[0, "name"] = self.name
-        (self.user_data).loc[0, "age"] = self.age
+        # Create user record with name and age
+        self.record = ApplicantRecord(name = self.name, age = self.age)
+        self.data = {}
 
         # Set interaction stage to zero. See more...
 
@@ -52,50 +47,69 @@ class LoanUser:
             return False
         return valid
 
-    def _generate_user_dataframe(self) -> None:
-        """
-        Create an empty pandas dataframe associated with this user
+    @property
+    def user_data(self) -> pd.DataFrame:
+        """One-row pandas dataframe with data of this user. Built on every access, use .record to read or change single fields
 
+        Returns:
+            pd.DataFrame: user data. See ApplicantRecord.to_frame()
         """
-        self.user_data = pd.DataFrame(columns = LoanUser.__column_names)
+
+        return self.record.to_frame()
 
     def update_stage(self) -> None:
-        """Proceeds to the next stage of user interaction with LoanBot
+        """Proceeds to the next stage of user interaction with LoanBot. Saves the session if this user has a session store
         """
         self.stage += 1
-        
 
-    def _is_in_table(self, db: LoanDatabase) -> bool:
-        """Determines whether an entry already exists for this user. Checks for unique user id in loan table
+        if self.session_store is not None:
+            self.session_store.save(self.session_key, self.to_record())
+
+    def to_record(self) -> dict:
+        """Compact JSON serializable copy of this user. Only filled columns are kept
+
+        Returns:
+            dict: session record. See .from_record()
+        """
+
+        data: dict = {col: value for col, value in self.record.to_dict().items() if value is not None}
+
+        return {"stage": self.stage, "name": self.name, "age": self.age, "user_id": self.user_id, "data": data}
+
+    @classmethod
+    def from_record(cls, record: dict) -> "LoanUser":
+        """Restore a user from a session record
 
         Args:
-            db (LoanDatabase): loan database object
+            record (dict): session record. See .to_record()
 
         Returns:
-            bool: True if entry for this user already exists in this database. False otherwise
+            LoanUser: user object at the same stage as the saved one
         """
-        try:
-            result = (db.read_query(f"SELECT count(*) FROM {LoanDatabase.table_name} WHERE id = '{self.user_id}'"))[0][0] != 0
-            return result
-        except mysql.connector.Error:
-            return False
+
+        usr = cls(record["name"], record["age"])
+        usr.user_id = record["user_id"]
+        usr.stage = record["stage"]
+
+        usr.push_to_df(list(record["data"].keys()), list(record["data"].values()))
+
+        return usr
+        
 
     def push_to_df(self, col_names: list, values: list) -> None:
-        """Copy specified values from LoanUser object to designated pandas DataFrame. Value index must correspond to the index of column name. 
+        """Copy specified values from LoanUser object to the user record. Value index must correspond to the index of column name. 
 
         Args:
-            col_names (list): A list of column names to which add values. Must be names of the columns. See LoanUser._generate_user_dataframe()
-            values (list): A list of value which will be added to the dataframe
+            col_names (list): A list of column names to which add values. Must be names of the columns. See ApplicantRecord.columns
+            values (list): A list of value which will be added to the record
         """
 
-        for col in col_names:
-            (self.user_data).loc[0, col] = values[col_names.index(col)]
+        self.record.update(col_names, values)
 
 
     def dump_data_to_sql(self, db: LoanDatabase) -> int:
-        """Upload user dataframe to MySQL Server. Uploads entire data that has been collected from the user. 
-        This method will replace any data if previously inserted with new values. To insert specific
-        values use: .update_user_data() method instead.
+        """Upload user record to MySQL Server. Uploads entire data that has been collected from the user. 
+        This method will replace any data if previously inserted with new values in a single statement. See LoanDatabase.upsert_rows()
 
         Args:
             db (LoanDatabase): Database object connected MySQL Server
@@ -103,41 +117,34 @@ class LoanUser:
         Returns:
             int: 1 if data has been uploaded successfully; 0 otherwise
         """
-             
-        if (not self.__is_in_table(db)):
-
-            try:
-                self.user_data.to_sql(con = db.engine, name = LoanDatabase.table_name, if_exists = 'append')
-            except sqlalchemy.exc.SQLAlchemyError:
-                    return 0
-            return 1
-
-        else:
-            try:
-                db.execute_query(f"DELETE FROM {LoanDatabase.table_name} WHERE id = '{self.user_id}'")
-                self.dump_data_to_sql(db)
-            except mysql.connector.Error:
-                return 0
+
+        try:
+            db.upsert_rows(ApplicantRecord.columns, [self.record.to_row()])
+        except (mysql.connector.Error, PoolTimeoutError):
+            return 0
+
+        return 1
     
-    def get_user_data(self, db: LoanDatabase) -> pd.DataFrame:
-        """Read data of this user from your MySQL Server.
+    def get_user_data(self, db: LoanDatabase, as_frame: bool = False) -> Union[ApplicantRecord, pd.DataFrame, None]:
+        """Read data of this user from your MySQL Server. Recently read users are served from the cache of the database. See LoanDatabase.fetch_row()
 
         Args:
             db (LoanDatabase): Database object connected MySQL Server
+            as_frame (bool, optional): return a one-row pandas dataframe instead of a record. Defaults to False.
 
         Returns:
-            pd.DataFrame: Pandas dataframe with user data fetched from MySQL Server or None if user doesn't exist
+            Union[ApplicantRecord, pd.DataFrame, None]: user data fetched from MySQL Server or None if user doesn't exist
         """
 
         try:
-             sql_user = pd.read_sql_query(f"SELECT * FROM {LoanDatabase.table_name} WHERE id = '{self.user_id}'", con = db.connection)
-             if sql_user.empty:
-                raise ValueError("No data found for this user")
-             user_data = pd.DataFrame(sql_user, columns = LoanUser.__column_names)
-        except (pd.errors.DatabaseError, pd.errors.ProgrammingError): # Database issues
-            user_data = None
-        except (ValueError):  # No user data
-            user_data = None
-
-        return user_data
+            row = db.fetch_row(self.user_id)
+        except (mysql.connector.Error, PoolTimeoutError): # Database issues
+            return None
+
+        if row is None: # No user data
+            return None
+
+        record = ApplicantRecord.from_row(row)
+
+        return record.to_frame() if as_frame else record
 
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class LRUCache(object):
+    """Thread-safe least recently used cache with a fixed capacity and optional time to live. Counts hits and misses
+    """
+
+    def __init__(self, capacity: int = 256, ttl: float = None) -> None:
+        """Construct an empty cache
+
+        Args:
+            capacity (int, optional): maximum number of entries. The least recently used entry is evicted when the cache is full. Defaults to 256.
+            ttl (float, optional): seconds after which an entry expires. Entries never expire if None. Defaults to None.
+        """
+
+        self.capacity = capacity
+        self.ttl = ttl
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+        self._entries: OrderedDict = OrderedDict() # Key -> (expiry time or None, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: object = None) -> Optional[object]:
+        """Get a value and mark it as recently used
+
+        Args:
+            key (Hashable): key of the entry
+            default (object, optional): value returned if there is no such entry. Defaults to None.
+
+        Returns:
+            Optional[object]: cached value or default
+        """
+
+        with self._lock:
+            expires, value = self._entries.get(key, (None, default))
+
+            if key not in self._entries or (expires is not None and expires <= time.monotonic()):
+                self._entries.pop(key, None)
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def put(self, key: Hashable, value: object) -> None:
+        """Add or replace an entry. Evicts the least recently used entry if the cache is full
+
+        Args:
+            key (Hashable): key of the entry
+            value (object): value to be cached
+        """
+
+        if self.capacity <= 0:
+            return
+
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last = False)
+
+    def pop(self, key: Hashable) -> None:
+        """Remove an entry if it exists
+
+        Args:
+            key (Hashable): key of the entry
+        """
+
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove all entries. Hit and miss counts are kept
+        """
+
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Usage statistics of this cache
+
+        Returns:
+            dict: number of entries, hits, misses and hit rate
+        """
+
+        lookups = self.hits + self.misses
+
+        return {"size": len(self._entries), "capacity": self.capacity, "hits": self.hits, "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0}
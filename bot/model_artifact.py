@@ -0,0 +1,109 @@
+import numpy as np
+import json
+import os
+import shutil
+from typing import Dict
+
+
+class ModelArtifact(object):
+    """Model saved as a directory of uncompressed .npy arrays and a small JSON manifest. Arrays are loaded with np.load(mmap_mode = 'r'),
+    so every process on a host that loads the same artifact shares the same physical pages instead of keeping a private copy
+    """
+
+    manifest_name: str = "manifest.json"
+    format_version: int = 1
+
+    def __init__(self, kind: str, arrays: Dict[str, np.ndarray], metadata: dict = None) -> None:
+        """Construct an artifact
+
+        Args:
+            kind (str): type of the model stored in this artifact. Checked when the artifact is loaded
+            arrays (Dict[str, np.ndarray]): numerical arrays of the model. Must not be object arrays
+            metadata (dict, optional): small JSON serializable values, like column names. Defaults to None.
+        """
+
+        self.kind = kind
+        self.arrays = arrays
+        self.metadata = metadata or {}
+
+    @staticmethod
+    def manifest_path(directory: str) -> str:
+        """Path to the manifest of an artifact. The manifest is replaced every time the artifact is saved
+
+        Args:
+            directory (str): directory of the artifact
+
+        Returns:
+            str: path to the manifest
+        """
+
+        return os.path.join(directory, ModelArtifact.manifest_name)
+
+    def save(self, directory: str) -> None:
+        """Save this artifact. Files are written to a temporary directory first and then swapped in,
+        so processes that have the old arrays mapped keep reading consistent data
+
+        Args:
+            directory (str): directory of the artifact
+        """
+
+        temp_directory = f"{directory}.tmp-{os.getpid()}"
+        old_directory = f"{directory}.old-{os.getpid()}"
+
+        shutil.rmtree(temp_directory, ignore_errors = True)
+        os.makedirs(temp_directory)
+
+        manifest = {"format": ModelArtifact.format_version, "kind": self.kind, "arrays": {}, "metadata": self.metadata}
+
+        for name, array in self.arrays.items():
+            array = np.ascontiguousarray(array)
+
+            if array.dtype == object:
+                raise ValueError(f"Array '{name}' can't be memory-mapped because it holds python objects")
+
+            np.save(os.path.join(temp_directory, f"{name}.npy"), array, allow_pickle = False)
+            manifest["arrays"][name] = {"file": f"{name}.npy", "dtype": array.dtype.str, "shape": list(array.shape)}
+
+        with open(ModelArtifact.manifest_path(temp_directory), "w") as file:
+            json.dump(manifest, file, indent = 2)
+
+        # Swap directories
+        if os.path.exists(directory):
+            os.replace(directory, old_directory)
+
+        os.replace(temp_directory, directory)
+        shutil.rmtree(old_directory, ignore_errors = True)
+
+    @classmethod
+    def load(cls, directory: str, kind: str, mmap: bool = True) -> "ModelArtifact":
+        """Load an artifact saved with .save()
+
+        Args:
+            directory (str): directory of the artifact
+            kind (str): expected type of the model
+            mmap (bool, optional): memory-map arrays read-only instead of reading them into private memory. Defaults to True.
+
+        Raises:
+            ValueError: if the artifact holds a different type of model or has an unsupported format
+
+        Returns:
+            ModelArtifact: loaded artifact
+        """
+
+        with open(ModelArtifact.manifest_path(directory)) as file:
+            manifest = json.load(file)
+
+        if manifest.get("format") != ModelArtifact.format_version or manifest.get("kind") != kind:
+            raise ValueError(f"{directory} is not a '{kind}' artifact of format {ModelArtifact.format_version}")
+
+        arrays = {}
+
+        for name, description in manifest["arrays"].items():
+            array = np.load(os.path.join(directory, description["file"]), mmap_mode = "r" if mmap else None, allow_pickle = False)
+
+            if array.dtype.str != description["dtype"] or list(array.shape) != description["shape"]:
+                raise ValueError(f"Array '{name}' of {directory} doesn't match its manifest")
+
+            arrays[name] = array
+
+        return cls(kind, arrays, manifest["metadata"])
@@ -0,0 +1,279 @@
+import itertools
+import numpy as np
+import pickle
+import os
+import threading
+from typing import Dict, Optional
+from bot.country_index import DevelopedCountryIndex
+from bot.compiled_risk import CompiledRiskModel
+from bot.flat_forest import FlatForest
+from bot.model_artifact import ModelArtifact
+from bot.ordinal_encoding import OrdinalTable
+
+# sklearn is imported only when a model has to be restored from sklearn objects. Compiled models don't need it
+
+
+class ModelBundle(object):
+    """Immutable snapshot of every model and encoder used for a prediction. A bundle is never modified after it has been built,
+    so it can be shared read-only between all predictions. See ModelRegistry
+    """
+
+    _serials = itertools.count(1) # Source of serial numbers. Shared by all registries of the process
+
+    def __init__(self, salary_model: object, risk_model: object, salary_encoder: object, risk_encoder: object,
+                 risk_pca: object, compiled_risk: Optional[CompiledRiskModel], country_index: DevelopedCountryIndex, version: int) -> None:
+        """Construct a bundle of loaded models
+
+        Args:
+            salary_model (object): fitted salary prediction model or its flattened version
+            risk_model (object): fitted risk prediction model or None if compiled risk model is used
+            salary_encoder (OrdinalTable): encoder for categorical columns of the salary model
+            risk_encoder (OrdinalTable): encoder for categorical columns of the risk model or None if compiled risk model is used
+            risk_pca (PCA): PCA used to rotate risk model features or None if compiled risk model is used
+            compiled_risk (Optional[CompiledRiskModel]): NumPy-only risk pipeline or None if sklearn objects are used
+            country_index (DevelopedCountryIndex): index of developed countries
+            version (int): version of this bundle. Incremented every time models are reloaded
+        """
+
+        self.salary_model = salary_model
+        self.risk_model = risk_model
+        self.salary_encoder = salary_encoder
+        self.risk_encoder = risk_encoder
+        self.risk_pca = risk_pca
+        self.compiled_risk = compiled_risk
+        self.country_index = country_index
+        self.version = version
+        self.serial: int = next(ModelBundle._serials) # Unique within the process, unlike version, which every registry counts on its own
+
+
+class ModelRegistry(object):
+    """Process-wide registry of ML models. Loads all models and encoders once and shares them between all predictions.
+    Models can be hot-reloaded with .reload() when files change on disk
+    """
+
+    # Default names for ML models
+    salary_model_filename: str = os.path.join('models', "salary_model.sav")
+    risk_model_filename: str = os.path.join('models', "risk_model.sav")
+
+    # Encoders
+    risk_encoder: str = os.path.join('encoders', "risk_encoder.npy")
+    risk_pca: str = os.path.join('encoders', "risk_pca.sav")
+    risk_pca_mean: str = os.path.join('encoders', "risk_pca_mean.sav")
+    salary_encoder: str = os.path.join('encoders', "salary_encoder.npy")
+
+    # Risk encoder, PCA and model compiled to NumPy. Used instead of sklearn objects if it exists. See CompiledRiskModel
+    compiled_risk_model: str = os.path.join('models', "risk_compiled")
+
+    # Salary random forest flattened into NumPy arrays. Used instead of the pickled forest if it exists. See FlatForest
+    flat_salary_model: str = os.path.join('models', "salary_forest")
+
+    # Developed countries. Precomputed index is optional, HDI dataset is used if it doesn't exist
+    country_index: str = os.path.join('encoders', "developed_countries.npy")
+    hdi_dataset: str = os.path.join('data', "HDI.csv")
+
+    _shared = None # Process-wide instance. See ModelRegistry.shared()
+    _shared_lock = threading.Lock()
+
+    def __init__(self, use_compiled: bool = True, mmap: bool = True) -> None:
+        """Construct an empty registry. Models are loaded on the first call to .load() or .get()
+
+        Args:
+            use_compiled (bool, optional): use compiled models when they exist on disk. Defaults to True.
+            mmap (bool, optional): memory-map compiled models so all processes on a host share one copy. Defaults to True.
+        """
+
+        self.use_compiled = use_compiled
+        self.mmap = mmap
+
+        self.bundle: Optional[ModelBundle] = None
+        self.version: int = 0
+
+        self._mtimes: Dict[str, Optional[int]] = {} # Modification time of every file at the moment it was loaded
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> "ModelRegistry":
+        """Get the process-wide registry
+
+        Returns:
+            ModelRegistry: registry shared by all predictors in this process
+        """
+
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls()
+
+        return cls._shared
+
+    def _files(self) -> list:
+        """All files this registry depends on
+
+        Returns:
+            list: paths to the models and encoders
+        """
+
+        return [self.salary_model_filename, self.risk_model_filename, self.salary_encoder, self.risk_encoder, self.risk_pca, self.risk_pca_mean,
+            ModelArtifact.manifest_path(self.compiled_risk_model), ModelArtifact.manifest_path(self.flat_salary_model), self.country_index, self.hdi_dataset]
+
+    @staticmethod
+    def _load_pickle(file_name: str) -> object:
+        """Loads a pickled object from a file
+
+        Args:
+            file_name (str): name of the file
+
+        Returns:
+            object: any object that has been saved in a given file
+        """
+
+        with open(file_name, "rb") as file:
+            return pickle.load(file)
+
+    def _build_bundle(self) -> ModelBundle:
+        """Load every model and encoder from disk
+
+        Returns:
+            ModelBundle: new snapshot of the models
+        """
+
+        risk_model, risk_encoder, pca, compiled_risk = None, None, None, None
+
+        if self.use_compiled and os.path.exists(ModelArtifact.manifest_path(self.compiled_risk_model)):
+            compiled_risk = CompiledRiskModel.load(self.compiled_risk_model, mmap = self.mmap)
+        else:
+            from sklearn.decomposition import PCA
+
+            pca = PCA()
+            pca.components_ = self._load_pickle(self.risk_pca)
+            pca.mean_ = self._load_pickle(self.risk_pca_mean)
+
+            risk_model = self._load_pickle(self.risk_model_filename)
+            risk_encoder = OrdinalTable.load(self.risk_encoder)
+
+        if self.use_compiled and os.path.exists(ModelArtifact.manifest_path(self.flat_salary_model)):
+            salary_model = FlatForest.load(self.flat_salary_model, mmap = self.mmap)
+        else:
+            salary_model = self._load_pickle(self.salary_model_filename)
+
+        return ModelBundle(
+            salary_model = salary_model,
+            risk_model = risk_model,
+            salary_encoder = OrdinalTable.load(self.salary_encoder),
+            risk_encoder = risk_encoder,
+            risk_pca = pca,
+            compiled_risk = compiled_risk,
+            country_index = DevelopedCountryIndex.load_or_build(self.country_index, self.hdi_dataset),
+            version = self.version + 1
+        )
+
+    def _current_mtimes(self) -> Dict[str, Optional[int]]:
+        """Read modification times of all files on disk
+
+        Returns:
+            Dict[str, Optional[int]]: modification time in nanoseconds for each file or None if optional file doesn't exist
+        """
+
+        mtimes = {}
+
+        for file_name in self._files():
+            try:
+                mtimes[file_name] = os.stat(file_name).st_mtime_ns
+            except FileNotFoundError:
+                mtimes[file_name] = None
+
+        return mtimes
+
+    def load(self) -> ModelBundle:
+        """Load all models from disk and replace current bundle. Predictions that already hold the old bundle are not affected
+
+        Returns:
+            ModelBundle: newly loaded bundle
+        """
+
+        with self._lock:
+            mtimes = self._current_mtimes()
+            bundle = self._build_bundle()
+
+            self._mtimes = mtimes
+            self.version = bundle.version
+            self.bundle = bundle # Swap in a single assignment so readers never see a partial bundle
+
+        return bundle
+
+    def is_stale(self) -> bool:
+        """Checks whether any file has been changed on disk since models were loaded
+
+        Returns:
+            bool: True if models should be reloaded. False otherwise
+        """
+
+        try:
+            return self.bundle is None or self._current_mtimes() != self._mtimes
+        except OSError: # File is being replaced right now. Keep current models
+            return False
+
+    def reload(self, force: bool = False) -> bool:
+        """Hot-reload models if files have changed on disk
+
+        Args:
+            force (bool, optional): reload even if no files have changed. Defaults to False.
+
+        Returns:
+            bool: True if models have been reloaded. False otherwise
+        """
+
+        if not force and not self.is_stale():
+            return False
+
+        self.load()
+
+        return True
+
+    def compile_risk_model(self, columns: list, categorical_columns: list) -> CompiledRiskModel:
+        """Compile sklearn risk encoder, PCA and model into a NumPy-only model and save it next to the other models.
+        Requires sklearn and the original risk model files
+
+        Args:
+            columns (list): names of all risk model features in the order used for training
+            categorical_columns (list): names of categorical risk model features in the order used by the encoder
+
+        Returns:
+            CompiledRiskModel: compiled model
+        """
+
+        compiled_risk = CompiledRiskModel.from_sklearn(
+            model = self._load_pickle(self.risk_model_filename),
+            pca_components = self._load_pickle(self.risk_pca),
+            pca_mean = self._load_pickle(self.risk_pca_mean),
+            categories = list(np.load(self.risk_encoder, allow_pickle = True)),
+            columns = columns,
+            categorical_columns = categorical_columns
+        )
+        compiled_risk.save(self.compiled_risk_model)
+
+        return compiled_risk
+
+    def compile_salary_model(self) -> FlatForest:
+        """Flatten the pickled salary random forest into NumPy arrays and save it next to the other models. Requires sklearn and the original model file
+
+        Returns:
+            FlatForest: flattened forest
+        """
+
+        flat_forest = FlatForest.from_sklearn(self._load_pickle(self.salary_model_filename))
+        flat_forest.save(self.flat_salary_model)
+
+        return flat_forest
+
+    def get(self) -> ModelBundle:
+        """Get current models. Loads them if this registry is still empty
+
+        Returns:
+            ModelBundle: current snapshot of the models
+        """
+
+        if (bundle := self.bundle) is None:
+            bundle = self.load()
+
+        return bundle
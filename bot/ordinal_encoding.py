@@ -0,0 +1,82 @@
+import numpy as np
+from typing import List
+
+
+class OrdinalLookup(object):
+    """NumPy replacement of a fitted sklearn OrdinalEncoder for a single column. Categories must be sorted, as they are in categories_ of a fitted encoder
+    """
+
+    def __init__(self, categories: np.ndarray) -> None:
+        """Construct a lookup table
+
+        Args:
+            categories (np.ndarray): sorted categories of the column
+        """
+
+        self.categories: np.ndarray = np.asarray(categories, dtype = str)
+
+    def transform(self, values) -> np.ndarray:
+        """Encode values as their indices in categories
+
+        Args:
+            values (Iterable): values of the column
+
+        Raises:
+            ValueError: if there are categories that were unknown during training
+
+        Returns:
+            np.ndarray: code of each value
+        """
+
+        values = np.asarray(values, dtype = str)
+        codes = np.searchsorted(self.categories, values)
+        codes[codes == len(self.categories)] = 0 # Values past the last category are unknown, clip them for the comparison below
+
+        if not np.all(known := self.categories[codes] == values):
+            raise ValueError(f"Found unknown categories {np.unique(values[~known]).tolist()} during transform")
+
+        return codes
+
+
+class OrdinalTable(object):
+    """NumPy replacement of a fitted sklearn OrdinalEncoder for several columns. Has the same .transform() interface
+    """
+
+    def __init__(self, categories: List[np.ndarray]) -> None:
+        """Construct lookup tables for each column
+
+        Args:
+            categories (List[np.ndarray]): categories_ of a fitted OrdinalEncoder
+        """
+
+        self.lookups: List[OrdinalLookup] = [OrdinalLookup(column_categories) for column_categories in categories]
+
+    @classmethod
+    def load(cls, file_name: str) -> "OrdinalTable":
+        """Load categories saved by the training scripts with np.save(file_name, encoder.categories_)
+
+        Args:
+            file_name (str): path to the .npy file
+
+        Returns:
+            OrdinalTable: lookup tables for each column
+        """
+
+        return cls(list(np.load(file_name, allow_pickle = True)))
+
+    def transform(self, X) -> np.ndarray:
+        """Encode every column
+
+        Args:
+            X (array-like): (n_rows, n_columns) matrix of categorical values
+
+        Raises:
+            ValueError: if there are categories that were unknown during training
+
+        Returns:
+            np.ndarray: (n_rows, n_columns) matrix of codes
+        """
+
+        X = np.asarray(X, dtype = object).reshape(-1, len(self.lookups))
+
+        return np.column_stack([lookup.transform(X[:, index]) for index, lookup in enumerate(self.lookups)]).astype(np.float64)
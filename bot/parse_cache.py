@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+from bot.lru_cache import LRUCache
+
+
+class ParseCache(object):
+    """Cache of parsed loan applications keyed by SHA-256 of the pdf file. Applicants often resubmit the same file after an error,
+    so it is parsed only once. Keeps recent applications in memory and, optionally, on disk, where they survive a restart.
+    Both tiers hold at most capacity applications for at most ttl seconds, since applications contain personal data
+    """
+
+    def __init__(self, capacity: int = 256, directory: str = None, ttl: float = 86400) -> None:
+        """Construct a parse cache. Expired entries left on disk by an earlier run are removed
+
+        Args:
+            capacity (int, optional): number of applications kept in memory and on disk. Defaults to 256.
+            directory (str, optional): directory for the on-disk tier. Disabled if None. Defaults to None.
+            ttl (float, optional): seconds an application is kept after it has been parsed. Kept until evicted if None. Defaults to 86400.
+        """
+
+        self.memory = LRUCache(capacity, ttl)
+        self.directory = directory
+        self.ttl = ttl
+
+        self.disk_hits: int = 0
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok = True)
+            self._evict()
+
+    @staticmethod
+    def digest(document: bytes) -> str:
+        """Content hash of a pdf file
+
+        Args:
+            document (bytes): content of the file
+
+        Returns:
+            str: SHA-256 of the content as a hex string
+        """
+
+        return hashlib.sha256(document).hexdigest()
+
+    def _disk_path(self, digest: str) -> str:
+        """Path to the on-disk entry of a document
+
+        Args:
+            digest (str): content hash of the document
+
+        Returns:
+            str: path to the .json file
+        """
+
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, digest: str) -> Optional[dict]:
+        """Get parsed fields of a document. Looks in memory first and then on disk
+
+        Args:
+            digest (str): content hash of the document. See .digest()
+
+        Returns:
+            Optional[dict]: copy of parsed fields or None if this document hasn't been parsed yet
+        """
+
+        if (usr_data := self.memory.get(digest)) is not None:
+            return dict(usr_data)
+
+        if self.directory is None:
+            return None
+
+        try:
+            if self._is_expired(os.path.getmtime(self._disk_path(digest))):
+                os.remove(self._disk_path(digest))
+                return None
+
+            with open(self._disk_path(digest)) as file:
+                usr_data = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        self.disk_hits += 1
+        self.memory.put(digest, usr_data) # Promote to memory
+
+        return dict(usr_data)
+
+    def put(self, digest: str, usr_data: dict) -> None:
+        """Store parsed fields of a document
+
+        Args:
+            digest (str): content hash of the document. See .digest()
+            usr_data (dict): parsed fields. See LoanApplicationParser.parse()
+        """
+
+        self.memory.put(digest, dict(usr_data))
+
+        if self.directory is None:
+            return
+
+        temp_path = f"{self._disk_path(digest)}.tmp"
+
+        try:
+            with open(temp_path, "w") as file:
+                json.dump(usr_data, file)
+
+            os.replace(temp_path, self._disk_path(digest)) # Readers never see a partially written entry
+        except OSError:
+            return # Disk tier is best effort, memory still holds the entry
+
+        self._evict()
+
+    def _is_expired(self, written: float) -> bool:
+        """Tells whether an entry on disk is older than ttl
+
+        Args:
+            written (float): modification time of the entry
+
+        Returns:
+            bool: True if the entry must not be served anymore
+        """
+
+        return self.ttl is not None and time.time() - written >= self.ttl
+
+    def _evict(self) -> None:
+        """Remove expired entries from disk, then the oldest entries beyond capacity
+        """
+
+        entries = []
+
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+
+            try:
+                entries.append((os.path.getmtime(path := os.path.join(self.directory, name)), path))
+            except OSError: # Removed by another process meanwhile
+                continue
+
+        entries.sort(reverse = True) # Newest first
+
+        for position, (written, path) in enumerate(entries):
+            if position >= self.memory.capacity or self._is_expired(written):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        """Usage statistics of this cache
+
+        Returns:
+            dict: number of entries in memory, hits served from memory and from disk, misses and hit rate
+        """
+
+        lookups = self.memory.hits + self.memory.misses
+        misses = self.memory.misses - self.disk_hits # Lookups that had to be parsed with pdfplumber
+
+        return {"size": len(self.memory), "capacity": self.memory.capacity, "memory_hits": self.memory.hits, "disk_hits": self.disk_hits,
+            "misses": misses, "hit_rate": (lookups - misses) / lookups if lookups else 0.0}
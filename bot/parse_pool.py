@@ -0,0 +1,158 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Union
+from bot.application_parser import LoanApplicationParser
+from bot.parse_cache import ParseCache
+
+
+##  Exceptions
+class ParserBusyError(Exception):
+    pass
+
+
+def _parse_application(source: Union[str, bytes], fast: bool, raw_text: bool) -> dict:
+    """Parse a loan application in a worker process
+
+    Args:
+        source (Union[str, bytes]): path to the application or its content. See LoanApplicationParser
+        fast (bool): stop reading pages as soon as all fields have been found
+        raw_text (bool): use cheap text extraction without layout analysis
+
+    Returns:
+        dict: dictionary containing answers to question in loan application or an empty dictionary of could't parse file
+    """
+
+    return LoanApplicationParser(source, fast = fast, raw_text = raw_text).parse()
+
+
+class ParsePool(object):
+    """Bounded process pool for parsing loan applications. Text extraction is CPU heavy, so it runs outside of the event loop
+    and never blocks conversations with other users
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 16, timeout: float = 30, fast: bool = True, raw_text: bool = False,
+                 cache: ParseCache = None) -> None:
+        """Construct a parsing pool
+
+        Args:
+            workers (int, optional): number of worker processes. Defaults to 2.
+            max_queue (int, optional): maximum number of documents that are being parsed or wait for a worker. Defaults to 16.
+            timeout (float, optional): seconds to wait for a single document. Defaults to 30.
+            fast (bool, optional): stop reading pages as soon as all fields have been found. Defaults to True.
+            raw_text (bool, optional): use cheap text extraction without layout analysis. Defaults to False.
+            cache (ParseCache, optional): cache of parsed applications consulted before any parsing. Defaults to None.
+        """
+
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.fast = fast
+        self.raw_text = raw_text
+        self.cache = cache
+
+        self.executor = self._create_executor()
+        self.pending: int = 0 # Documents submitted to the pool that haven't finished yet
+
+        # Documents are handed to the executor only when a worker is free, so the timeout of a document starts when it's picked up
+        # and never includes time spent waiting behind other documents
+        self._free_workers = asyncio.Semaphore(workers)
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        """Start a new pool of worker processes. Workers are spawned rather than forked, so they don't inherit database connections
+        or locks held by threads of the bot
+
+        Returns:
+            ProcessPoolExecutor: new pool
+        """
+
+        return ProcessPoolExecutor(max_workers = self.workers, mp_context = multiprocessing.get_context("spawn"))
+
+    def _recycle(self, executor: ProcessPoolExecutor) -> None:
+        """Replace a pool whose worker is stuck on a document. A hung worker can't be interrupted, so all workers of the pool are terminated
+
+        Args:
+            executor (ProcessPoolExecutor): pool that ran the stuck document
+        """
+
+        if executor is not self.executor: # Already replaced after another timeout
+            return
+
+        self.executor = self._create_executor()
+
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
+
+        # Documents still queued in the old pool fail as broken and are parsed again in the new one
+        executor.shutdown(wait = False)
+
+    async def parse(self, source: Union[str, bytes]) -> dict:
+        """Parse a loan application in the pool
+
+        Args:
+            source (Union[str, bytes]): path to the application or its content. See LoanApplicationParser
+
+        Raises:
+            ParserBusyError: if there are already max_queue documents in the pool
+            asyncio.TimeoutError: if parsing took longer than timeout once a worker picked the document up
+
+        Returns:
+            dict: dictionary containing answers to question in loan application or an empty dictionary of could't parse file
+        """
+
+        # Resubmitted documents are served from the cache without touching the pool
+        if (digest := self._digest(source)) is not None and (usr_data := self.cache.get(digest)) is not None:
+            return usr_data
+
+        if self.pending >= self.max_queue:
+            raise ParserBusyError(f"There are already {self.pending} applications waiting to be parsed")
+
+        self.pending += 1 # Only modified from the event loop thread, no lock needed
+
+        try:
+            loop = asyncio.get_running_loop()
+
+            async with self._free_workers: # Kept while the document is parsed again after a recycle
+                while True:
+                    executor = self.executor
+
+                    try:
+                        usr_data = await asyncio.wait_for(loop.run_in_executor(executor, _parse_application, source, self.fast, self.raw_text), self.timeout)
+                        break
+                    except asyncio.TimeoutError:
+                        self._recycle(executor) # The document has been running for the whole timeout. Otherwise the worker stays busy with it
+                        raise
+                    except BrokenProcessPool:
+                        if executor is self.executor: # A worker crashed on this document. Treated like a file that can't be parsed
+                            self._recycle(executor)
+                            return {}
+                        # Terminated along with a stuck document of another user. Parsed again in the new pool
+        finally:
+            self.pending -= 1
+
+        if digest is not None and usr_data:
+            self.cache.put(digest, usr_data)
+
+        return usr_data
+
+    def _digest(self, source: Union[str, bytes]) -> Optional[str]:
+        """Content hash of a document used as a cache key
+
+        Args:
+            source (Union[str, bytes]): path to the application or its content
+
+        Returns:
+            Optional[str]: SHA-256 of the document or None if there is no cache or the document isn't in memory
+        """
+
+        if self.cache is None or not isinstance(source, (bytes, bytearray)):
+            return None
+
+        return ParseCache.digest(source)
+
+    def shutdown(self) -> None:
+        """Stop worker processes. Documents that are still being parsed are cancelled
+        """
+
+        self.executor.shutdown(wait = False, cancel_futures = True)
@@ -0,0 +1,152 @@
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+from bot.loan_user import LoanUser
+from bot.session_store import SessionStore
+
+
+class SessionManager(object):
+    """Keeps one application session per user in a channel. Every message is routed to its session with a single dictionary lookup,
+    and sessions that haven't received a message for a while are evicted. With a session store, sessions survive restarts of the bot
+    """
+
+    def __init__(self, idle_timeout: float = 1800, sweep_interval: float = 60, store: SessionStore = None) -> None:
+        """Construct an empty session manager
+
+        Args:
+            idle_timeout (float, optional): seconds after the last message when a session is considered abandoned. Defaults to 1800.
+            sweep_interval (float, optional): minimum number of seconds between two sweeps for idle sessions. Defaults to 60.
+            store (SessionStore, optional): storage for session records. Sessions live in memory only if None. Defaults to None.
+        """
+
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.store = store
+
+        # Sessions ordered by last activity, the least recently active first
+        self.sessions: OrderedDict = OrderedDict()
+        self.last_active: dict = {}
+
+        # Sessions saved before a restart that haven't been restored yet. Other messages never reach the store
+        self.restorable: set = set()
+
+        if store is not None:
+            self.restorable = set(store.keys(idle_timeout))
+            store.expire(idle_timeout)
+
+        self._last_sweep: float = time.monotonic()
+
+    @staticmethod
+    def key(channel_id: int, author_id: int) -> Tuple[int, int]:
+        """Key of a session
+
+        Args:
+            channel_id (int): id of the channel where the application takes place
+            author_id (int): id of the applicant
+
+        Returns:
+            Tuple[int, int]: session key
+        """
+
+        return (channel_id, author_id)
+
+    def open(self, key: Hashable, usr: LoanUser) -> None:
+        """Start a new session. Replaces an existing session with the same key
+
+        Args:
+            key (Hashable): session key. See .key()
+            usr (LoanUser): user object of this session
+        """
+
+        self._track(key, usr)
+        self.restorable.discard(key)
+
+        if self.store is not None:
+            self.store.save(key, usr.to_record())
+
+    def _track(self, key: Hashable, usr: LoanUser) -> None:
+        """Keep a session in memory and attach the session store to its user
+
+        Args:
+            key (Hashable): session key. See .key()
+            usr (LoanUser): user object of this session
+        """
+
+        usr.session_store = self.store
+        usr.session_key = key
+
+        self.sessions[key] = usr
+        self.sessions.move_to_end(key)
+        self.last_active[key] = time.monotonic()
+
+    def get(self, key: Hashable) -> Optional[LoanUser]:
+        """Find the session of a message and mark it as active. Sessions saved before a restart are restored from the session store
+
+        Args:
+            key (Hashable): session key. See .key()
+
+        Returns:
+            Optional[LoanUser]: user object of the session or None if there is no such session
+        """
+
+        if (usr := self.sessions.get(key)) is not None:
+            self.sessions.move_to_end(key)
+            self.last_active[key] = time.monotonic()
+        elif key in self.restorable: # Session started before a restart
+            self.restorable.discard(key)
+
+            if (record := self.store.load(key)) is not None:
+                usr = LoanUser.from_record(record)
+                self._track(key, usr)
+
+        return usr
+
+    def close(self, key: Hashable) -> None:
+        """End a session
+
+        Args:
+            key (Hashable): session key. See .key()
+        """
+
+        self.sessions.pop(key, None)
+        self.last_active.pop(key, None)
+        self.restorable.discard(key)
+
+        if self.store is not None:
+            self.store.delete(key)
+
+    def evict_idle(self, force: bool = False) -> int:
+        """Close sessions that have been idle for longer than idle_timeout. Runs at most once per sweep_interval unless forced
+
+        Args:
+            force (bool, optional): sweep even if the last sweep was recent. Defaults to False.
+
+        Returns:
+            int: number of evicted sessions
+        """
+
+        now = time.monotonic()
+
+        if not force and now - self._last_sweep < self.sweep_interval:
+            return 0
+
+        self._last_sweep = now
+        evicted = 0
+
+        # Sessions are ordered by activity, so the sweep stops at the first active one
+        while self.sessions:
+            key = next(iter(self.sessions))
+
+            if now - self.last_active[key] < self.idle_timeout:
+                break
+
+            self.close(key)
+            evicted += 1
+
+        if self.store is not None:
+            self.store.expire(self.idle_timeout) # Sessions abandoned before a restart are never evicted from memory
+
+        return evicted
+
+    def __len__(self) -> int:
+        return len(self.sessions)
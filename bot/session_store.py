@@ -0,0 +1,379 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Hashable, Optional, Tuple
+from bot.loan_database import LoanDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(object):
+    """Base class for storages of session records. A record is a small JSON serializable dictionary. See LoanUser.to_record()
+    """
+
+    @staticmethod
+    def encode_key(key: Hashable) -> str:
+        """Turn a session key into a string
+
+        Args:
+            key (Hashable): session key. See SessionManager.key()
+
+        Returns:
+            str: key as "channel_id:author_id"
+        """
+
+        return ":".join(str(part) for part in key) if isinstance(key, tuple) else str(key)
+
+    @staticmethod
+    def decode_key(key: str) -> tuple:
+        """Turn a string back into a session key
+
+        Args:
+            key (str): key created by .encode_key()
+
+        Returns:
+            tuple: session key
+        """
+
+        return tuple(int(part) for part in key.split(":"))
+
+    def save(self, key: Hashable, record: dict) -> None:
+        """Add or replace a session record
+
+        Args:
+            key (Hashable): session key
+            record (dict): session record
+        """
+
+        self.save_many({key: record})
+
+    def save_many(self, records: Dict[Hashable, dict]) -> None:
+        """Add or replace several session records at once
+
+        Args:
+            records (Dict[Hashable, dict]): session records by key
+        """
+
+        raise NotImplementedError
+
+    def load(self, key: Hashable) -> Optional[dict]:
+        """Find a session record
+
+        Args:
+            key (Hashable): session key
+
+        Returns:
+            Optional[dict]: session record or None if there is no such session
+        """
+
+        raise NotImplementedError
+
+    def keys(self, max_age: float = None) -> list:
+        """Keys of stored sessions
+
+        Args:
+            max_age (float, optional): only sessions saved within this many seconds. All sessions if None. Defaults to None.
+
+        Returns:
+            list: session keys
+        """
+
+        raise NotImplementedError
+
+    def expire(self, max_age: float) -> None:
+        """Remove sessions that haven't been saved for a while. Abandoned applications would stay in the store forever otherwise
+
+        Args:
+            max_age (float): seconds since the last save after which a session is removed
+        """
+
+        raise NotImplementedError
+
+    def delete(self, key: Hashable) -> None:
+        """Remove a session record
+
+        Args:
+            key (Hashable): session key
+        """
+
+        self.delete_many([key])
+
+    def delete_many(self, keys: list) -> None:
+        """Remove several session records at once
+
+        Args:
+            keys (list): session keys
+        """
+
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release resources of this store
+        """
+
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Keeps session records in process memory. Records are lost on restart
+    """
+
+    def __init__(self) -> None:
+        self.records: Dict[str, Tuple[str, float]] = {} # Key -> (serialized record, time of the last save)
+
+    def save_many(self, records: Dict[Hashable, dict]) -> None:
+        for key, record in records.items():
+            self.records[SessionStore.encode_key(key)] = (json.dumps(record), time.time()) # Serialized, so stored records never share state with live users
+
+    def load(self, key: Hashable) -> Optional[dict]:
+        if (record := self.records.get(SessionStore.encode_key(key))) is None:
+            return None
+
+        return json.loads(record[0])
+
+    def keys(self, max_age: float = None) -> list:
+        oldest = time.time() - max_age if max_age is not None else float("-inf")
+
+        return [SessionStore.decode_key(key) for key, (_, updated_at) in list(self.records.items()) if updated_at >= oldest]
+
+    def expire(self, max_age: float) -> None:
+        oldest = time.time() - max_age
+
+        for key, (_, updated_at) in list(self.records.items()):
+            if updated_at < oldest:
+                self.records.pop(key, None)
+
+    def delete_many(self, keys: list) -> None:
+        for key in keys:
+            self.records.pop(SessionStore.encode_key(key), None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Keeps session records in a local SQLite database. Records survive restarts of a single bot process
+    """
+
+    table_name: str = "session_table"
+
+    def __init__(self, file_name: str = "sessions.db") -> None:
+        """Open or create an SQLite session database
+
+        Args:
+            file_name (str, optional): path to the database file. Defaults to "sessions.db".
+        """
+
+        self.connection = sqlite3.connect(file_name, check_same_thread = False)
+        self._lock = threading.Lock()
+
+        with self._lock:
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS {SQLiteSessionStore.table_name} (session_key TEXT PRIMARY KEY, record TEXT NOT NULL, updated_at REAL NOT NULL)")
+            self.connection.commit()
+
+    def save_many(self, records: Dict[Hashable, dict]) -> None:
+        rows = [(SessionStore.encode_key(key), json.dumps(record), time.time()) for key, record in records.items()]
+
+        with self._lock:
+            self.connection.executemany(f"INSERT OR REPLACE INTO {SQLiteSessionStore.table_name} VALUES (?, ?, ?)", rows)
+            self.connection.commit()
+
+    def load(self, key: Hashable) -> Optional[dict]:
+        with self._lock:
+            row = self.connection.execute(f"SELECT record FROM {SQLiteSessionStore.table_name} WHERE session_key = ?", (SessionStore.encode_key(key),)).fetchone()
+
+        return json.loads(row[0]) if row is not None else None
+
+    def keys(self, max_age: float = None) -> list:
+        oldest = time.time() - max_age if max_age is not None else float("-inf")
+
+        with self._lock:
+            rows = self.connection.execute(f"SELECT session_key FROM {SQLiteSessionStore.table_name} WHERE updated_at >= ?", (oldest,)).fetchall()
+
+        return [SessionStore.decode_key(row[0]) for row in rows]
+
+    def expire(self, max_age: float) -> None:
+        with self._lock:
+            self.connection.execute(f"DELETE FROM {SQLiteSessionStore.table_name} WHERE updated_at < ?", (time.time() - max_age,))
+            self.connection.commit()
+
+    def delete_many(self, keys: list) -> None:
+        with self._lock:
+            self.connection.executemany(f"DELETE FROM {SQLiteSessionStore.table_name} WHERE session_key = ?", [(SessionStore.encode_key(key),) for key in keys])
+            self.connection.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self.connection.close()
+
+
+class MySQLSessionStore(SessionStore):
+    """Keeps session records in a MySQL table of the loan database. Records are shared by every bot process connected to the same server
+    """
+
+    table_name: str = "session_table"
+
+    def __init__(self, db: LoanDatabase) -> None:
+        """Create the session table if it doesn't exist
+
+        Args:
+            db (LoanDatabase): Database object connected MySQL Server
+        """
+
+        self.db = db
+
+        self.db.execute_query(f"CREATE TABLE IF NOT EXISTS {MySQLSessionStore.table_name} (session_key VARCHAR(64) PRIMARY KEY, record TEXT NOT NULL, "
+            "updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP)")
+
+    def save_many(self, records: Dict[Hashable, dict]) -> None:
+        rows = [(SessionStore.encode_key(key), json.dumps(record)) for key, record in records.items()]
+
+        # Time of the save is set explicitly, ON UPDATE leaves it unchanged when the record is the same
+        self.db.execute_many(f"INSERT INTO {MySQLSessionStore.table_name} (session_key, record) VALUES (%s, %s) "
+            "ON DUPLICATE KEY UPDATE record = VALUES(record), updated_at = CURRENT_TIMESTAMP", rows)
+
+    def load(self, key: Hashable) -> Optional[dict]:
+        rows = self.db.read_query(f"SELECT record FROM {MySQLSessionStore.table_name} WHERE session_key = %s", (SessionStore.encode_key(key),))
+
+        return json.loads(rows[0][0]) if rows else None
+
+    def keys(self, max_age: float = None) -> list:
+        if max_age is None:
+            rows = self.db.read_query(f"SELECT session_key FROM {MySQLSessionStore.table_name}")
+        else:
+            rows = self.db.read_query(f"SELECT session_key FROM {MySQLSessionStore.table_name} WHERE updated_at >= NOW() - INTERVAL %s SECOND", (int(max_age),))
+
+        return [SessionStore.decode_key(row[0]) for row in rows]
+
+    def expire(self, max_age: float) -> None:
+        self.db.execute_query(f"DELETE FROM {MySQLSessionStore.table_name} WHERE updated_at < NOW() - INTERVAL %s SECOND", (int(max_age),))
+
+    def delete_many(self, keys: list) -> None:
+        self.db.execute_many(f"DELETE FROM {MySQLSessionStore.table_name} WHERE session_key = %s", [(SessionStore.encode_key(key),) for key in keys])
+
+
+class WriteBehindSessionStore(SessionStore):
+    """Buffers writes to another store and flushes them in batches from a background thread, so the message handlers never wait for the disk
+    or the database. Several writes to the same session between two flushes are coalesced into one
+    """
+
+    def __init__(self, store: SessionStore, batch_size: int = 64, flush_interval: float = 0.5) -> None:
+        """Start a write-behind buffer
+
+        Args:
+            store (SessionStore): store that receives the writes
+            batch_size (int, optional): number of buffered sessions that triggers an early flush. Defaults to 64.
+            flush_interval (float, optional): maximum number of seconds a write waits in the buffer. Defaults to 0.5.
+        """
+
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.pending: Dict[Hashable, Optional[dict]] = {} # Buffered writes. None marks a deleted session
+        self.expire_age: Optional[float] = None # Age of sessions to remove on the next flush. See .expire()
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+
+        self._thread = threading.Thread(target = self._run, name = "session-write-behind", daemon = True)
+        self._thread.start()
+
+    def save_many(self, records: Dict[Hashable, dict]) -> None:
+        with self._lock:
+            self.pending.update(records)
+            full = len(self.pending) >= self.batch_size
+
+        if full:
+            self._wake.set()
+
+    def load(self, key: Hashable) -> Optional[dict]:
+        with self._lock:
+            if key in self.pending: # Buffered write is newer than the stored one
+                return self.pending[key]
+
+        return self.store.load(key)
+
+    def keys(self, max_age: float = None) -> list:
+        with self._lock:
+            pending = dict(self.pending)
+
+        keys = set(self.store.keys(max_age)) - {key for key, record in pending.items() if record is None}
+
+        return list(keys | {key for key, record in pending.items() if record is not None})
+
+    def expire(self, max_age: float) -> None:
+        """Remove old sessions on the next flush, outside of the calling thread. See SessionStore.expire()
+
+        Args:
+            max_age (float): seconds since the last save after which a session is removed
+        """
+
+        with self._lock:
+            self.expire_age = max_age
+
+    def delete_many(self, keys: list) -> None:
+        with self._lock:
+            self.pending.update(dict.fromkeys(keys))
+
+    def flush(self) -> None:
+        """Write all buffered sessions to the underlying store
+        """
+
+        with self._lock:
+            pending, self.pending = self.pending, {}
+            expire_age, self.expire_age = self.expire_age, None
+
+        # Buffered sessions are written first, so their fresh save times keep them
+        self._write(pending)
+
+        if expire_age is not None:
+            try:
+                self.store.expire(expire_age)
+            except Exception as err:
+                logger.warning("Couldn't remove expired sessions. Error: %s", err)
+
+    def _write(self, pending: Dict[Hashable, Optional[dict]]) -> None:
+        """Write buffered sessions to the underlying store. Failed writes are buffered again
+
+        Args:
+            pending (Dict[Hashable, Optional[dict]]): buffered writes. None marks a deleted session
+        """
+
+        if not pending:
+            return
+
+        records = {key: record for key, record in pending.items() if record is not None}
+        deleted = [key for key, record in pending.items() if record is None]
+
+        try:
+            if records:
+                self.store.save_many(records)
+            if deleted:
+                self.store.delete_many(deleted)
+        except Exception as err:
+            with self._lock:
+                for key, record in pending.items(): # Retry on the next flush unless there is a newer write
+                    self.pending.setdefault(key, record)
+
+            logger.warning("Couldn't save sessions, will retry. Error: %s", err)
+
+    def _run(self) -> None:
+        """Background thread. Flushes the buffer every flush_interval seconds or as soon as it is full
+        """
+
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self) -> None:
+        """Flush remaining writes and stop the background thread
+        """
+
+        self._stopped = True
+        self._wake.set()
+        self._thread.join()
+
+        self.flush()
+        self.store.close()
@@ -0,0 +1,66 @@
+import mysql.connector
+import threading
+import weakref
+from collections import OrderedDict
+
+
+class StatementCache(object):
+    """Server-side prepared statements, kept per connection. A statement is prepared the first time a query runs on a connection
+    and every later run only sends the parameters, so the server doesn't parse and plan the query again
+    """
+
+    def __init__(self, capacity: int = 64) -> None:
+        """Construct an empty cache
+
+        Args:
+            capacity (int, optional): maximum number of prepared statements per connection. Least recently used are closed first. Defaults to 64.
+        """
+
+        self.capacity = capacity
+
+        # Connection -> (server connection id, OrderedDict of query -> (query, prepared cursor)). Forgotten with the connection
+        self._statements: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def execute(self, connection: mysql.connector.MySQLConnection, query: str, params: tuple = None) -> "mysql.connector.cursor.MySQLCursorPrepared":
+        """Run a query as a prepared statement. The connection must be checked out by the calling thread
+
+        Args:
+            connection (MySQLConnection): connection that runs the query
+            query (str): SQL query with %s placeholders
+            params (tuple, optional): values for the placeholders. Defaults to None.
+
+        Returns:
+            MySQLCursorPrepared: cursor that has executed the query. Its rows must be fetched before the connection runs another query
+        """
+
+        with self._lock:
+            connection_id, statements = self._statements.get(connection, (None, None))
+
+            # Statements die with the server session, a reconnected connection starts over
+            if statements is None or connection_id != connection.connection_id:
+                statements = OrderedDict()
+                self._statements[connection] = (connection.connection_id, statements)
+
+        if (cached := statements.get(query)) is not None:
+            statements.move_to_end(query)
+        else:
+            cached = statements[query] = (query, connection.cursor(prepared = True))
+
+            if len(statements) > self.capacity:
+                _, (_, evicted) = statements.popitem(last = False)
+
+                try:
+                    evicted.close() # Deallocates the statement on the server
+                except mysql.connector.Error:
+                    pass
+
+        # Cursors only skip preparing when they get the very same query object they prepared
+        prepared_query, cursor = cached
+        cursor.execute(prepared_query, params)
+
+        return cursor
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(statements) for _, statements in self._statements.values())
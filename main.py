@@ -1,14 +1,35 @@
+import argparse
 import configparser
+import datetime
 import sys
 
 from bot.loan_bot import LoanBot
+from bot.loan_predictor import LoanPredictor
+from bot.loan_database import LoanDatabase
+from bot.loan_export import LoanExporter
+from bot.bulk_scoring import BulkScorer
 from typing import Dict, Tuple
 
 
 def main():
 
+    args = get_arguments()
+
+    if args.command == "compile-models":
+        LoanPredictor.compile_models()
+        print("Compiled models have been saved")
+        return
+
     config = configparser.ConfigParser()
 
+    if args.command == "export":
+        export(args, config)
+        return
+
+    if args.command == "score":
+        score(args, config)
+        return
+
     try:
         token, configs = get_configs(config)
     except configparser.NoOptionError:
@@ -22,6 +43,91 @@ def main():
     loan_bot.run(token)
     
 
+def get_arguments() -> argparse.Namespace:
+    """Parse command line arguments. Runs the bot if no command is given
+
+    Returns:
+        argparse.Namespace: parsed arguments
+    """
+
+    parser = argparse.ArgumentParser(description = "Loan Bot")
+    commands = parser.add_subparsers(dest = "command")
+
+    commands.add_parser("run", help = "Run the discord bot (default)")
+    commands.add_parser("compile-models", help = "Compile sklearn risk model into a NumPy-only model. Requires sklearn")
+
+    export_parser = commands.add_parser("export", help = "Stream the loan table to a CSV or Parquet file")
+    export_parser.add_argument("--out", required = True, help = "Output file. Format is taken from the extension unless --format is given")
+    export_parser.add_argument("--format", choices = LoanExporter.formats, help = "Output format")
+    export_parser.add_argument("--since", type = datetime.date.fromisoformat, help = "Export applications created on or after this day (YYYY-MM-DD)")
+    export_parser.add_argument("--until", type = datetime.date.fromisoformat, help = "Export applications created before this day (YYYY-MM-DD)")
+    export_parser.add_argument("--grade", action = "append", help = "Export this loan grade only. Repeat for several grades")
+    export_parser.add_argument("--chunk-size", type = int, default = 10000, help = "Rows fetched and written at once")
+
+    score_parser = commands.add_parser("score", help = "Score a CSV or Parquet file of applicants without the bot")
+    score_parser.add_argument("--in", dest = "in_path", required = True, help = "Applicants. Must include columns used by both ML models")
+    score_parser.add_argument("--out", required = True, help = "Scored applicants with income, chance_of_default and interest_rate columns")
+    score_parser.add_argument("--workers", type = int, default = None, help = "Worker processes. 0 scores in this process. Defaults to the number of CPUs")
+    score_parser.add_argument("--chunk-size", type = int, default = 50000, help = "Applicants read and scored at once")
+    score_parser.add_argument("--theta", type = float, default = 0, help = "Minimum profit rate of the loan issuer")
+    score_parser.add_argument("--normalization", type = float, default = None, help = "Interest rate weight normalization. Defaults to the value in config.txt")
+
+    return parser.parse_args()
+
+
+def export(args: argparse.Namespace, parser: configparser.ConfigParser) -> None:
+    """Export the loan table. See LoanExporter
+
+    Args:
+        args (argparse.Namespace): arguments of the export command
+        parser (configparser.ConfigParser): parser of the config file
+    """
+
+    parser.read("config.txt")
+
+    # A single connection is enough for a sequential export
+    db = LoanDatabase(parser.get('database', 'username'), parser.get('database', 'hostname'), parser.get('database', 'password'),
+        pool_min_size = 1, pool_size = 1)
+
+    try:
+        exported = LoanExporter(db, args.chunk_size).export(args.out, args.format, args.since, args.until, args.grade)
+    except (ValueError, ImportError) as err:
+        print(err)
+        raise SystemExit(1)
+    finally:
+        db.close()
+
+    print(f"Exported {exported} applications to {args.out}")
+
+
+def score(args: argparse.Namespace, parser: configparser.ConfigParser) -> None:
+    """Score a file of applicants. See BulkScorer
+
+    Args:
+        args (argparse.Namespace): arguments of the score command
+        parser (configparser.ConfigParser): parser of the config file
+    """
+
+    parser.read("config.txt")
+
+    normalization = args.normalization
+    if normalization is None:
+        normalization = float(parser.get('model', 'interest_normalization', fallback = '') or 0)
+
+    scorer = BulkScorer(args.workers, args.chunk_size, args.theta, normalization)
+
+    try:
+        scored, failed = scorer.score(args.in_path, args.out)
+    except (ValueError, ImportError) as err:
+        print(err)
+        raise SystemExit(1)
+
+    print(f"Scored {scored} applicants to {args.out}")
+
+    if failed:
+        print(f"{failed} applicants couldn't be scored, see {args.out}.errors.csv")
+
+
 def get_configs(parser: configparser.ConfigParser) -> Tuple[str, Dict[str, str]]:
 
     # Read the config file
@@ -32,13 +138,39 @@ def get_configs(parser: configparser.ConfigParser) -> Tuple[str, Dict[str, str]]
     'username': parser.get('database', 'username'),
     'hostname': parser.get('database', 'hostname'),
     'password': parser.get('database', 'password'),
+    'db_pool_min_size': parser.get('database', 'pool_min_size', fallback = '1'),
+    'db_pool_size': parser.get('database', 'pool_size', fallback = '8'),
+    'db_pool_timeout': parser.get('database', 'pool_timeout', fallback = '10'),
+    'db_batch_size': parser.get('database', 'batch_size', fallback = '100'),
+    'db_flush_interval': parser.get('database', 'flush_interval', fallback = '0.5'),
+    'db_max_queue': parser.get('database', 'max_queue', fallback = '10000'),
+    'db_user_cache_size': parser.get('database', 'user_cache_size', fallback = '1024'),
+    'db_user_cache_ttl': parser.get('database', 'user_cache_ttl', fallback = '60'),
     'token': parser.get('bot', 'token'),
-    'normalization': parser.get('model', 'interest_normalization')}
+    'normalization': parser.get('model', 'interest_normalization'),
+    'prediction_cache_size': parser.get('model', 'cache_size', fallback = '4096'),
+    'parser_workers': parser.get('parser', 'workers', fallback = '2'),
+    'parser_queue': parser.get('parser', 'max_queue', fallback = '16'),
+    'parser_timeout': parser.get('parser', 'timeout', fallback = '30'),
+    'parser_cache_size': parser.get('parser', 'cache_size', fallback = '256'),
+    'parser_cache_ttl': parser.get('parser', 'cache_ttl', fallback = '86400'),
+    'session_timeout': parser.get('session', 'idle_timeout', fallback = '1800'),
+    'session_store': parser.get('session', 'store', fallback = 'memory'),
+    'session_path': parser.get('session', 'path', fallback = 'sessions.db'),
+    'session_batch_size': parser.get('session', 'batch_size', fallback = '64'),
+    'session_flush_interval': parser.get('session', 'flush_interval', fallback = '0.5')}
 
     for value in configs.values():
         if not value:
             raise ValueError("One or more configurations are empty or None")
         
+    # Optional values. Checked separately since False and empty values are valid
+    configs['db_pre_ping'] = parser.getboolean('database', 'pre_ping', fallback = True)
+    configs['db_journal'] = parser.get('database', 'journal', fallback = '') or None
+    configs['parser_fast'] = parser.getboolean('parser', 'fast', fallback = True)
+    configs['parser_raw_text'] = parser.getboolean('parser', 'raw_text', fallback = False)
+    configs['parser_cache_dir'] = parser.get('parser', 'cache_dir', fallback = '') or None
+
     token: str = configs.pop('token')
         
     return token, configs
@@ -184,6 +184,12 @@ for country in range(0, len(developed_countries)):
     developed_countries[country] = developed_countries[country].replace(" ", "-") # Repalce space between words in a country name with a "-"
     
 
+# Save precomputed index of developed countries for deployment. See bot/country_index.py
+
+if (save_as_sav):
+    np.save("developed_countries.npy", np.array(sorted(developed_countries), dtype = str))
+
+
 # Replace native-country values 
 
 salary_data["native-country"] = np.where(salary_data["native-country"].isin(developed_countries), "developed", "developing")